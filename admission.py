@@ -0,0 +1,3 @@
+from libs.admission import AdmissionQueue
+
+admission = AdmissionQueue()
@@ -1,25 +1,41 @@
 import logging
 import os
 import sys
-from datetime import datetime
 
-from flask_apscheduler import APScheduler
 from flask import Flask, jsonify
 from flask_restful import Api
 from flask_jwt_extended import JWTManager
 from marshmallow import ValidationError
-from flask_uploads import configure_uploads, patch_request_class
+from flask_uploads import configure_uploads
 from dotenv import load_dotenv
 
+load_dotenv(".env", verbose=True)  # before the local imports, libs.mailgun and libs.twilio read their settings
+
+from admission import admission
+from cache import cache
 from db import db
+from metrics import metrics
+from outbox import outbox
 from ma import ma
+from scheduler import scheduler
 from blacklist import BLACKLIST
-from resources.course import Course, CourseList, GetEnrolledUsers, EnrollUser, DisenrollUser
-from resources.user import UserRegister, UserLogin, User, TokenRefresh, UserLogout, UserChangePassword
-from resources.confirmation import Confirmation, ConfirmationByUser, ConfirmationByCode
-from resources.image import ImageUpload
+from resources.course import (
+    Course, CourseList, GetEnrolledUsers, EnrollUser, DisenrollUser, EnrollmentBatch, EnrollmentTicket, Timetable,
+    CourseAnnouncement, CacheStats
+)
+from resources.user import UserRegister, UserLogin, User, TokenRefresh, UserLogout, UserChangePassword, UserImport
+from resources.confirmation import Confirmation, ConfirmationByUser, ConfirmationByCode, OutboxMessage, OutboxByUser
+from resources.image import ImageUpload, Image
+from resources.metrics import Metrics
+from models.confirmation import ConfirmationModel
 from models.course import CourseModel
+from libs import db_profile
+from libs import image_helper
+from libs import serialization
+from libs import strings
+from libs.member_import import import_members_command
 from libs.image_helper import IMAGE_SET
+from utils import password_manager
 import atexit
 
 
@@ -27,13 +43,19 @@ app = Flask(__name__)
 if 'DYNO' in os.environ:
     app.logger.addHandler(logging.StreamHandler(sys.stdout))
     app.logger.setLevel(logging.ERROR)
-load_dotenv(".env", verbose=True)
 app.config.from_object("default_config")  # load default configs from default_config.py
 app.config.from_envvar(
     "APPLICATION_SETTINGS"
 )  # override with config.py (APPLICATION_SETTINGS points to config.py)
-patch_request_class(app, 10 * 1024 * 1024)
+strings.init_app(app)
 configure_uploads(app, IMAGE_SET)
+image_helper.init_app(app)
+db_profile.init_app(app)
+cache.init_app(app)
+BLACKLIST.init_app(app)
+metrics.init_app(app)
+password_manager.init_app(app)
+serialization.init_app(app)
 
 api = Api(app)
 
@@ -43,12 +65,23 @@ def create_tables():
     db.create_all()
 
 
+outbox.init_app(app)  # registered after create_tables, the delivery workers start on the first request
+admission.init_app(app)
+
+
 @app.errorhandler(ValidationError)
 def handle_marshmallow_validation(err):
     return jsonify(err.messages), 400
 
 
 jwt = JWTManager(app)
+app.cli.add_command(import_members_command)
+
+
+# Staff members (ADMIN_USER_IDS) get the is_admin claim, required by the member import and the announcements
+@jwt.user_claims_loader
+def add_claims_to_jwt(identity):
+    return {"is_admin": identity in app.config.get("ADMIN_USER_IDS", ())}
 
 
 # This method will check if a token is blacklisted, and will be called automatically when blacklist is enabled
@@ -59,6 +92,7 @@ def check_if_token_in_blacklist(decrypted_token):
 
 api.add_resource(UserRegister, "/register")
 api.add_resource(User, "/user/<int:user_id>")
+api.add_resource(UserImport, "/users/import")
 api.add_resource(UserLogin, "/login")
 api.add_resource(UserChangePassword, "/change_password/<int:user_id>")
 api.add_resource(TokenRefresh, "/refresh")
@@ -66,12 +100,21 @@ api.add_resource(UserLogout, "/logout")
 api.add_resource(Confirmation, "/user_confirm/<string:confirmation_id>")
 api.add_resource(ConfirmationByUser, "/confirmation/user/<int:user_id>")
 api.add_resource(ConfirmationByCode, "/confirmation_code/user/<int:user_id>")
+api.add_resource(OutboxMessage, "/outbox/<int:message_id>")
+api.add_resource(OutboxByUser, "/outbox/user/<int:user_id>")
 api.add_resource(ImageUpload, "/upload/image")
+api.add_resource(Image, "/image/<string:filename>")
 api.add_resource(Course, "/course/<int:course_id>", "/course/<string:name>")
 api.add_resource(CourseList, "/courses")
 api.add_resource(EnrollUser, "/enroll/")
 api.add_resource(DisenrollUser, "/disenroll/")
+api.add_resource(EnrollmentBatch, "/enrollments/batch")
+api.add_resource(EnrollmentTicket, "/enroll/ticket/<string:ticket>")
 api.add_resource(GetEnrolledUsers, "/enrolled_users/<int:course_id>")
+api.add_resource(CourseAnnouncement, "/course/<int:course_id>/announcement")
+api.add_resource(Timetable, "/timetable")
+api.add_resource(CacheStats, "/cache/stats")
+api.add_resource(Metrics, "/metrics")
 
 
 # Config scheduling of Jobs
@@ -79,30 +122,35 @@ class Config(object):
     JOBS = [
         {
             'id': 'clear_courses',
-            'func': CourseModel.clear_all,
-            'args': (datetime.today().weekday(), True),
+            'func': CourseModel.clear_today,
+            'args': (True,),
             'trigger': 'cron',
             'hour': 23,
             'minute': 00
+        },
+        {
+            'id': 'purge_confirmations',
+            'func': ConfirmationModel.purge,
+            'args': (True,),
+            'trigger': 'cron',
+            'minute': 30
         }
     ]
 
     SCHEDULER_API_ENABLED = True
 
 
+scheduler.init_app(app, Config.JOBS)  # with SCHEDULER_MODE = "leader", one uwsgi worker runs the jobs
+atexit.register(scheduler.shutdown)
+
 if __name__ == "__main__":
     db.init_app(app)
     db.app = app
     ma.init_app(app)
-    app.config.from_object(Config())
-    # Jobs
-    cron = APScheduler()
-    cron.init_app(app)
-    # Explicitly kick off the background thread
-    cron.start()
-
-    # Shutdown your cron thread if the web process is stopped
-    atexit.register(lambda: cron.shutdown(wait=False))
+    app.config["SCHEDULER_API_ENABLED"] = Config.SCHEDULER_API_ENABLED  # the jobs are added by scheduler
+    # Jobs, explicitly kick off the background thread
+    scheduler.start()
+
     # Start Flask APP
     app.run(port=5000, host='0.0.0.0')
 
@@ -0,0 +1,158 @@
+"""
+Concurrent clients sustained by `run:app` under uvicorn's WSGI bridge (see run.py) and under uwsgi.ini.
+
+Seeds a SQLite database (see benchmarks.load), starts each server on it in turn, then for every level of
+`--clients` keeps that many keep-alive clients requesting `--path` for `--duration` seconds. Clients wait
+`--think-ms` between requests, like members polling an enrollment ticket, and send the last line of each request
+`--trickle-ms` after the rest, like members on a slow mobile connection. A level is sustained when no request
+failed and the p95 latency stays under `--slo-ms`. Needs uwsgi and uvicorn installed; run from the repository
+root:
+
+    python -m benchmarks.concurrency --clients 25 50 100 200 400 --trickle-ms 50
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.load import boot, percentile
+
+SERVERS = {
+    "uwsgi": lambda port: ["uwsgi", "--ini", "uwsgi.ini"],
+    "uvicorn": lambda port: [sys.executable, "-m", "uvicorn", "run:app", "--interface", "wsgi", "--port", str(port),
+                             "--no-access-log"],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(server: str, port: int) -> subprocess.Popen:
+    process = subprocess.Popen(
+        SERVERS[server](port), env=dict(os.environ, PORT=str(port)), stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{server} did not start on port {port}")
+
+
+async def read_response(reader) -> tuple:
+    """
+    (status, keep alive) of the next response, its body is read and dropped
+    """
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    headers = dict(line.lower().split(": ", 1) for line in lines[1:] if ": " in line)
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+        keep_alive = headers.get("connection") != "close" and lines[0].startswith("HTTP/1.1")
+    else:
+        await reader.read()
+        keep_alive = False
+    return status, keep_alive
+
+
+async def client(port: int, path: str, until: float, args, latencies: list, errors: list) -> None:
+    request = f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n".encode()
+    connection = None
+    while time.time() < until:
+        start = time.perf_counter()
+        for _ in range(2):
+            reused = connection is not None
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), args.timeout)
+                reader, writer = connection
+                writer.write(request)
+                await writer.drain()
+                if args.trickle_ms:
+                    await asyncio.sleep(args.trickle_ms / 1000)
+                writer.write(b"\r\n")
+                status, keep_alive = await asyncio.wait_for(read_response(reader), args.timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                if connection is not None:
+                    connection[1].close()
+                    connection = None
+                if reused and not isinstance(e, asyncio.TimeoutError):
+                    continue  # the server closed the idle connection, retry on a new one like any http client
+                errors.append(type(e).__name__)
+                break
+            if status != 200:
+                errors.append(status)
+            else:
+                latencies.append(time.perf_counter() - start)
+            if not keep_alive:
+                writer.close()
+                connection = None
+            break
+        await asyncio.sleep(args.think_ms / 1000)
+    if connection is not None:
+        connection[1].close()
+
+
+async def level(port: int, clients: int, args) -> tuple:
+    latencies, errors = [], []
+    until = time.time() + args.duration
+    await asyncio.gather(*(client(port, args.path, until, args, latencies, errors) for _ in range(clients)))
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", nargs="+", choices=sorted(SERVERS), default=["uwsgi", "uvicorn"])
+    parser.add_argument("--clients", nargs="+", type=int, default=[25, 50, 100, 200, 400])
+    parser.add_argument("--path", default="/timetable")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--think-ms", type=float, default=100.0)
+    parser.add_argument("--trickle-ms", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--slo-ms", type=float, default=500.0)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--courses", type=int, default=50)
+    args = parser.parse_args()
+
+    if "uwsgi" in args.server and not shutil.which("uwsgi"):
+        sys.exit("uwsgi is not installed")
+    boot(args.users, args.courses, 20)  # seeds the database and points DATABASE_URL at it for the servers
+    os.environ["RESPONSE_CACHE_BACKEND"] = "uwsgi"  # as deployed, uvicorn falls back to the lru cache
+
+    sustained = {}
+    print(f"{'server':<7} {'clients':>7} {'req/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'errors':>7}")
+    for server in args.server:
+        port = free_port()
+        process = start(server, port)
+        try:
+            for clients in args.clients:
+                latencies, errors = asyncio.get_event_loop().run_until_complete(level(port, clients, args))
+                latencies.sort()
+                p95 = percentile(latencies, 95) * 1000 if latencies else float("inf")
+                print(f"{server:<7} {clients:>7} {len(latencies) / args.duration:>8.1f} "
+                      f"{(percentile(latencies, 50) * 1000 if latencies else float('inf')):>7.1f} {p95:>7.1f} "
+                      f"{len(errors):>7}")
+                if not errors and p95 <= args.slo_ms:
+                    sustained[server] = clients
+        finally:
+            process.terminate()
+            process.wait()
+    for server in args.server:
+        print(f"{server}: sustains {sustained.get(server, 0)} concurrent clients "
+              f"(no errors, p95 under {args.slo_ms:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
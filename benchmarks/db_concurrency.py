@@ -0,0 +1,85 @@
+"""
+SQLite read/write concurrency with and without the engine profile of libs.db_profile.
+
+Reader threads run the timetable query while writer threads enroll and disenroll, each on its own connection,
+for `--seconds`; the run is repeated with SQLite's defaults (rollback journal, synchronous=FULL) and with the
+profile (WAL, synchronous=NORMAL, busy_timeout, mmap). Run from the repository root:
+
+    python -m benchmarks.db_concurrency --readers 8 --writers 2 --seconds 5
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+from libs.db_profile import set_pragmas_on_connect, sqlite_pragmas
+
+SCHEMA = [
+    "CREATE TABLE courses (id INTEGER PRIMARY KEY, name VARCHAR(80), day_week INTEGER, start_time TIME)",
+    "CREATE TABLE association (courses INTEGER, users INTEGER, PRIMARY KEY (courses, users))",
+]
+READ = "SELECT id, name, day_week, start_time FROM courses ORDER BY day_week, start_time, id LIMIT 100"
+ENROLL = "INSERT OR IGNORE INTO association (courses, users) VALUES (:course, :user)"
+DISENROLL = "DELETE FROM association WHERE courses = :course AND users = :user"
+
+
+def run(profiled: bool, readers: int, writers: int, seconds: float) -> dict:
+    path = os.path.join(tempfile.mkdtemp(prefix="playrestapi-dbbench-"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    if profiled:
+        set_pragmas_on_connect(sqlite_pragmas({}), target=engine)
+    with engine.begin() as connection:
+        for statement in SCHEMA:
+            connection.execute(text(statement))
+        for n in range(200):
+            connection.execute(text("INSERT INTO courses VALUES (:id, :name, :day, '09:00:00')"),
+                               id=n, name=f"Class {n}", day=n % 6)
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def work(statements, key: str, seed: int):
+        i = 0
+        with engine.connect() as connection:
+            while time.perf_counter() < deadline:
+                i += 1
+                try:
+                    with connection.begin():
+                        for statement in statements:
+                            connection.execute(text(statement), course=i % 200, user=seed * 100000 + i)
+                    done = key
+                except Exception:  # "database is locked"
+                    done = "errors"
+                with lock:
+                    counts[done] += 1
+
+    threads = [threading.Thread(target=work, args=([READ], "reads", n)) for n in range(readers)]
+    threads += [threading.Thread(target=work, args=([ENROLL, DISENROLL], "writes", n)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return {key: value / seconds for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{'profile':<10} {'reads/s':>10} {'writes/s':>10} {'errors/s':>10}")
+    for profiled in (False, True):
+        result = run(profiled, args.readers, args.writers, args.seconds)
+        print(f"{'wal' if profiled else 'default':<10} {result['reads']:>10.1f} {result['writes']:>10.1f} "
+              f"{result['errors']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Load benchmarks for the REST endpoints.
+
+Boots `run:app` (the uwsgi entry point) in-process against a freshly seeded SQLite database, with Mailgun and
+Twilio replaced by the outbox FakeProvider, and drives each scenario from `--concurrency` threads. For every
+scenario it reports p50/p95/p99 latency, throughput, SQL queries per request and the status codes seen.
+Run from the repository root:
+
+    python -m benchmarks.load --output bench.json
+    python -m benchmarks.load --scenario enroll_storm login_burst --concurrency 32 --requests 2000
+    python -m benchmarks.load --compare bench.json --tolerance 0.15   # exits 1 on a regression
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time as time_of_day
+
+PASSWORD = "benchmark-password"
+SCENARIOS = {}
+
+
+def scenario(name: str):
+    def register(function):
+        SCENARIOS[name] = function
+        return function
+
+    return register
+
+
+@scenario("enroll_storm")
+def enroll_storm(client, i: int, seed: dict):
+    """
+    Every member tries to enroll in the same class the moment it opens
+    """
+    user_id = seed["users"][i % len(seed["users"])]
+    return client.post("/enroll/", json={"course_id": seed["hot_course"], "user_id": user_id})
+
+
+@scenario("timetable_polling")
+def timetable_polling(client, i: int, seed: dict):
+    """
+    Members' apps refreshing the timetable and the enrolled list of a class
+    """
+    if i % 2:
+        return client.get("/courses")
+    return client.get(f"/enrolled_users/{seed['courses'][i % len(seed['courses'])]}")
+
+
+@scenario("timetable_snapshot")
+def timetable_snapshot(client, i: int, seed: dict):
+    """
+    The same refresh served by /timetable: the whole week with the enrolled counts in one request
+    """
+    return client.get("/timetable")
+
+
+@scenario("login_burst")
+def login_burst(client, i: int, seed: dict):
+    return client.post("/login", json={"id": seed["users"][i % len(seed["users"])], "password": PASSWORD})
+
+
+@scenario("opening_hour")
+def opening_hour(client, i: int, seed: dict):
+    """
+    Realistic mix when classes open: mostly polling, some enrollments and logins
+    """
+    pick = random.Random(i).random()
+    if pick < 0.7:
+        return timetable_polling(client, i, seed)
+    if pick < 0.9:
+        return enroll_storm(client, i, seed)
+    return login_burst(client, i, seed)
+
+
+def boot(users: int, courses: int, slots: int):
+    """
+    Import the app configured for an isolated SQLite database and seed it, returns (app, seed)
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="playrestapi-bench-"), "bench.db")
+    os.environ.update({
+        "APPLICATION_SETTINGS": os.path.abspath("config.py"),
+        "DATABASE_URL": f"sqlite:///{path}",
+        "JWT_SECRET_KEY": os.environ.get("JWT_SECRET_KEY", "benchmark"),
+        "OUTBOX_PROVIDER": "fake",
+        "REVOCATION_BACKEND": "memory",
+        "RESPONSE_CACHE_BACKEND": "lru",
+    })
+    from run import app
+    from db import db
+    from models.confirmation import ConfirmationModel
+    from models.course import CourseModel
+    from models.user import UserModel
+    from utils.password_manager import encrypt_password
+
+    db.app = app
+    with app.app_context():
+        db.create_all()
+        hashed = encrypt_password(PASSWORD)
+        db.session.execute(UserModel.__table__.insert(), [
+            {"id": _id, "email": f"member{_id}@example.com", "name": f"Member {_id}", "password": hashed}
+            for _id in range(1, users + 1)
+        ])
+        confirmations = []
+        for _id in range(1, users + 1):
+            confirmation = ConfirmationModel(_id)
+            confirmation.confirmed = True
+            confirmations.append(confirmation)
+        db.session.add_all(confirmations)
+        db.session.add_all([
+            CourseModel(name=f"Class {n}", location="Main room", day_week=n % 6,
+                        start_time=time_of_day(7 + n % 14), slots=slots)
+            for n in range(courses)
+        ])
+        db.session.commit()
+        course_ids = [course.id for course in CourseModel.query.order_by(CourseModel.id)]
+    return app, {"users": list(range(1, users + 1)), "courses": course_ids, "hot_course": course_ids[0]}
+
+
+class QueryCounter:
+    """
+    Counts the SQL statements issued by the calling thread
+    """
+
+    def __init__(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        self._local = threading.local()
+        event.listen(Engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, "count", 0) + 1
+
+    def reset(self) -> None:
+        self._local.count = 0
+
+    @property
+    def count(self) -> int:
+        return getattr(self._local, "count", 0)
+
+
+def percentile(ordered: list, p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run_scenario(app, seed: dict, name: str, requests: int, concurrency: int, counter: QueryCounter) -> dict:
+    from db import db
+    from models.course import CourseModel
+
+    CourseModel.clear_all()  # every run starts from empty classes
+    clients = threading.local()
+
+    def one(i: int):
+        if not hasattr(clients, "client"):
+            clients.client = app.test_client()
+        counter.reset()
+        start = time.perf_counter()
+        try:
+            status = SCENARIOS[name](clients.client, i, seed).status_code
+        except Exception as e:  # PROPAGATE_EXCEPTIONS re-raises unhandled errors in the test client
+            status = type(e).__name__
+        return time.perf_counter() - start, status, counter.count
+
+    one(0)  # warm up (first request hooks, caches)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    with app.app_context():
+        db.session.remove()
+
+    latencies = sorted(latency for latency, _, _ in samples)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "throughput": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "queries_per_request": sum(queries for _, _, queries in samples) / requests,
+        "status_codes": dict(Counter(str(status) for _, status, _ in samples)),
+        "errors": sum(1 for _, status, _ in samples if not isinstance(status, int) or status >= 500),
+    }
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list:
+    """
+    Regressions of `current` against `baseline`, as readable strings
+    """
+    regressions = []
+    for name, result in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if not before:
+            continue
+        for metric in ("p95_ms", "p99_ms", "queries_per_request", "errors"):
+            if result[metric] > before[metric] * (1 + tolerance) and result[metric] - before[metric] > 1e-9:
+                regressions.append(f"{name}: {metric} {before[metric]:.2f} -> {result[metric]:.2f}")
+        if result["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput']:.1f} -> {result['throughput']:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--courses", type=int, default=60)
+    parser.add_argument("--slots", type=int, default=20)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    app, seed = boot(args.users, args.courses, args.slots)
+    counter = QueryCounter()
+    results = {"scenarios": {}}
+    for name in args.scenario:
+        result = run_scenario(app, seed, name, args.requests, args.concurrency, counter)
+        results["scenarios"][name] = result
+        print(f"{name:<18} {result['throughput']:>8.1f} req/s  p50 {result['p50_ms']:>7.2f}ms  "
+              f"p95 {result['p95_ms']:>7.2f}ms  p99 {result['p99_ms']:>7.2f}ms  "
+              f"{result['queries_per_request']:>5.2f} q/req  {result['status_codes']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Login throughput of utils.password_manager at several work factors.
+
+Each simulated login is one verify_and_update call, issued from `--threads` request threads at once, with
+hashing done inline (`--workers 0`) or in a process pool. Run from the repository root:
+
+    python -m benchmarks.password_hashing --rounds 3 10000 29000 100000 --workers 2
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import password_manager
+
+
+def logins_per_second(rounds: int, workers: int, threads: int, logins: int) -> float:
+    password_manager.rounds = rounds
+    password_manager.workers = workers
+    hashed = password_manager.encrypt_password("benchmark-password")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(
+            lambda _: password_manager.verify_and_update("benchmark-password", hashed), range(logins)
+        ))
+    elapsed = time.perf_counter() - start
+    assert all(valid for valid, _ in results)
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[3, 10000, 29000, 100000])
+    parser.add_argument("--workers", type=int, default=2, help="hashing processes, 0 hashes inline")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent logins")
+    parser.add_argument("--logins", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'rounds':>8} {'logins/s':>10} {'ms/login':>9}")
+    for rounds in args.rounds:
+        rate = logins_per_second(rounds, args.workers, args.threads, args.logins)
+        print(f"{rounds:>8} {rate:>10.1f} {1000 / rate:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Schema dumps against the FAST_SERIALIZER path of libs.serialization.
+
+Seeds `--rows` courses and members (see benchmarks.load), then times, for each path, dumping and encoding the
+whole course list and fetching and dumping every member like User.get. Both paths must produce the same data,
+the run fails otherwise. Run from the repository root:
+
+    python -m benchmarks.serialization --rows 10000
+"""
+import argparse
+import json
+import time
+
+from benchmarks.load import boot
+
+
+def timed(function) -> tuple:
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    app, seed = boot(args.rows, args.rows, 20)
+    from libs import serialization
+    from models.course import CourseModel
+    from models.user import UserModel
+    from schemas.course import CourseSchema, dump_course_row
+    from schemas.user import UserSchema, dump_user_row
+
+    course_list_schema = CourseSchema(many=True)
+    user_schema = UserSchema()
+    with app.test_request_context():
+        rows = CourseModel.find_page(args.rows)
+        cases = {
+            "course list": (
+                lambda: json.dumps(course_list_schema.dump(rows)).encode(),
+                lambda: serialization.dumps([dump_course_row(row) for row in rows]),
+            ),
+            "users": (
+                lambda: [user_schema.dump(UserModel.find_by_id(_id)) for _id in seed["users"]],
+                lambda: [dump_user_row(UserModel.find_row_by_id(_id)) for _id in seed["users"]],
+            ),
+        }
+        print(f"orjson: {'yes' if serialization.orjson else 'no'}")
+        print(f"{'case':<12} {'rows':>7} {'schema s':>9} {'fast s':>8} {'speedup':>8}")
+        for name, (schema_path, fast_path) in cases.items():
+            schema_seconds, expected = timed(schema_path)
+            fast_seconds, result = timed(fast_path)
+            if isinstance(expected, bytes):
+                expected, result = json.loads(expected), json.loads(result)
+            assert expected == result, f"{name}: the fast path output differs from the schema"
+            print(f"{name:<12} {args.rows:>7} {schema_seconds:>9.3f} {fast_seconds:>8.3f} "
+                  f"{schema_seconds / fast_seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Cold import time of `run` (the module uwsgi loads in every worker it spawns), with a budget.
+
+Imports it `--runs` times in fresh interpreters with `python -X importtime`, reports the median and the slowest
+modules of the median run, and exits 1 when the median is over `--budget-ms` or when one of the modules that
+must only be imported on first use (the provider SDKs, Pillow, APScheduler) was imported. Run from the
+repository root:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --budget-ms 600 --top 30
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+# imported lazily by libs.twilio, libs.mailgun, libs.image_helper and libs.scheduler
+LAZY_MODULES = ("twilio", "requests", "PIL", "apscheduler", "flask_apscheduler")
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_times(module: str) -> list:
+    """
+    (self us, cumulative us, depth, name) of every module imported by a fresh `import module`
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="playrestapi-startup-"), "startup.db")
+    env = dict(
+        os.environ,
+        APPLICATION_SETTINGS=os.path.abspath("config.py"),
+        DATABASE_URL=f"sqlite:///{path}",
+        JWT_SECRET_KEY=os.environ.get("JWT_SECRET_KEY", "benchmark"),
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True,
+    )
+    if result.returncode:
+        errors = [line for line in result.stderr.splitlines() if not LINE.match(line)]
+        sys.exit(f"import {module} failed:\n" + "\n".join(errors))
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            rows.append((int(own), int(cumulative), len(indent) // 2, name))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="run")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=800)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.runs):
+        rows = import_times(args.module)
+        total = next(cumulative for _, cumulative, _, name in rows if name == args.module)
+        runs.append((total, rows))
+    runs.sort(key=lambda run: run[0])
+    median_us, rows = runs[len(runs) // 2]
+
+    print(f"{'module':<50} {'self ms':>8} {'total ms':>9}")
+    for own, cumulative, depth, name in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"{'  ' * min(depth - 1, 8) + name:<50} {own / 1000:>8.1f} {cumulative / 1000:>9.1f}")
+    print(f"import {args.module}: median {median_us / 1000:.0f} ms over {args.runs} runs "
+          f"(min {runs[0][0] / 1000:.0f}, max {runs[-1][0] / 1000:.0f}), budget {args.budget_ms:.0f} ms")
+
+    failures = []
+    eager = sorted({name.split(".")[0] for _, _, _, name in rows} & set(LAZY_MODULES))
+    if eager:
+        failures.append(f"imported on startup, must be imported on first use: {', '.join(eager)}")
+    if median_us / 1000 > args.budget_ms:
+        failures.append(f"over the budget by {median_us / 1000 - args.budget_ms:.0f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,8 @@ blacklist.py
 
 This file just contains the blacklist of the JWT tokens–it will be imported by
 app and the logout resource so that tokens can be added to the blacklist when the
-user logs out.
+user logs out. See libs.revocation for how it is shared between uwsgi workers.
 """
+from libs.revocation import RevocationStore
 
-BLACKLIST = set()
+BLACKLIST = RevocationStore()
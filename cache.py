@@ -0,0 +1,3 @@
+from libs.response_cache import ResponseCache
+
+cache = ResponseCache()
@@ -2,3 +2,13 @@ import os
 
 DEBUG = False
 SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///data.db")
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "uwsgi")
+OUTBOX_PROVIDER = os.environ.get("OUTBOX_PROVIDER", "live")
+REVOCATION_BACKEND = os.environ.get("REVOCATION_BACKEND", "database")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 10000))
+USE_X_SENDFILE = os.environ.get("USE_X_SENDFILE", "") == "1"
+SCHEDULER_MODE = os.environ.get("SCHEDULER_MODE", "leader")
+STRINGS_RELOAD_INTERVAL = float(os.environ.get("STRINGS_RELOAD_INTERVAL", 0))
+ADMIN_USER_IDS = tuple(int(_id) for _id in os.environ.get("ADMIN_USER_IDS", "").split(",") if _id.strip())
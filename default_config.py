@@ -12,3 +12,44 @@ JWT_BLACKLIST_TOKEN_CHECKS = [
     "access",
     "refresh",
 ]  # allow blacklisting for access and refresh tokens
+RESPONSE_CACHE_BACKEND = "lru"  # "lru" (per worker) or "uwsgi" (shared by all uwsgi workers)
+RESPONSE_CACHE_SIZE = 1024  # max entries of the lru backend
+OUTBOX_PROVIDER = "live"  # "live" (Mailgun/Twilio) or "fake" (in-memory, for offline load tests)
+OUTBOX_WORKERS = 2  # delivery threads per process
+OUTBOX_BATCH_SIZE = 20
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_POLL_INTERVAL = 1.0  # seconds
+REVOCATION_BACKEND = "memory"  # "memory" (per process) or "database" (shared by all workers)
+REVOCATION_SYNC_INTERVAL = 1.0  # max seconds before a logout in another worker is seen
+PASSWORD_HASH_ROUNDS = 29000  # pbkdf2_sha256 work factor, older hashes are upgraded on login
+PASSWORD_HASH_WORKERS = 2  # hashing processes per worker, 0 hashes in the request thread
+METRICS_QUERY_BUDGET = 20  # SQL statements per request before it is reported as a likely N+1
+METRICS_PUBLISH_INTERVAL = 1.0  # seconds between snapshots published to the other uwsgi workers
+DB_POOL_SIZE = 5  # connection pool (ignored on SQLite)
+DB_MAX_OVERFLOW = 10
+DB_POOL_RECYCLE = 1800  # seconds
+DB_POOL_PRE_PING = True
+DB_STATEMENT_TIMEOUT_MS = 10000  # Postgres only
+SQLITE_JOURNAL_MODE = "WAL"  # readers don't block on the writer
+SQLITE_SYNCHRONOUS = "NORMAL"
+SQLITE_BUSY_TIMEOUT_MS = 5000
+SQLITE_MMAP_SIZE = 64 * 1024 * 1024
+MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # largest form body, answered with 413 when over it
+IMAGE_MAX_BYTES = 10 * 1024 * 1024  # uploads are rejected as soon as they grow past this
+IMAGE_THUMBNAIL_SIZES = (64, 256)  # bounding boxes of the generated thumbnails, in pixels
+IMAGE_THUMBNAIL_WORKERS = 2  # thumbnail threads per process, 0 disables thumbnails
+IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600  # served images never change, clients may keep them this long
+USE_X_SENDFILE = False  # let a front-end server (nginx, Apache) send the image files
+FAST_SERIALIZER = False  # dump the hot read endpoints from column rows with compiled converters (and orjson)
+ADMISSION_MODE = False  # queue enrollments and answer 202 with a ticket, see libs.admission
+ADMISSION_WORKERS = 1  # admission threads per process
+ADMISSION_BATCH_SIZE = 100  # requests of one course handled per transaction
+ADMISSION_POLL_INTERVAL = 1.0  # seconds between checks for new requests when idle
+ADMIN_USER_IDS = ()  # members whose tokens carry the is_admin claim (the club staff)
+IMPORT_BATCH_SIZE = 1000  # members per transaction of a bulk import
+IMPORT_CONFIRMATION_EXPIRATION = 7 * 24 * 3600  # imported members may confirm later than the usual 30 minutes
+TIMETABLE_CACHE = True  # keep /timetable in the response cache until an enrollment or course changes
+SCHEDULER_MODE = "off"  # "leader": the uwsgi workers elect one of them, through a lease row, to run Config.JOBS
+SCHEDULER_LEASE_SECONDS = 60  # a worker takes the jobs over this long after the leader stopped renewing
+STRINGS_DEFAULT_LOCALE = "en-gb"  # messages of the other strings/<locale>.json files fall back to this one
+STRINGS_RELOAD_INTERVAL = 0  # seconds between checks for edited strings files, 0 disables the hot reload
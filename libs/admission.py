@@ -0,0 +1,194 @@
+"""
+libs.admission
+
+Admission mode for enrollments (`ADMISSION_MODE = True`), for class openings where hundreds of members enroll in
+the same course within seconds.
+
+EnrollUser only queues an `EnrollmentRequestModel` and answers 202 with its ticket. Worker threads in each
+process pick the courses with work and handle their requests in arrival order, up to `ADMISSION_BATCH_SIZE` per
+transaction: one lock on the course row, one read of the requests, one multi-row insert of the enrollments and
+one counter update for the whole batch. Requests beyond the free slots are waitlisted; waitlisted requests come
+first whenever slots are freed again (e.g. by a disenroll), so the waitlist is promoted in order.
+"""
+import threading
+import traceback
+from time import time
+from typing import List
+
+from sqlalchemy import and_, bindparam, distinct, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from db import db
+from models.course import CourseModel, association_table
+from models.enrollment_request import EnrollmentRequestModel, ENROLLED, QUEUED, REJECTED, WAITLISTED
+
+
+def _outcome(_id: int, status: str, reason, processed_at) -> dict:
+    # parameters of the executemany UPDATE of the requests, column names are reserved for its SET clause
+    return {"_id": _id, "_status": status, "_reason": reason, "_processed_at": processed_at}
+
+
+class AdmissionQueue:
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.workers = 1
+        self.batch_size = 100
+        self.poll_interval = 1.0
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.enabled = app.config.get("ADMISSION_MODE", False)
+        self.workers = app.config.get("ADMISSION_WORKERS", 1)
+        self.batch_size = app.config.get("ADMISSION_BATCH_SIZE", 100)
+        self.poll_interval = app.config.get("ADMISSION_POLL_INTERVAL", 1.0)
+        if self.enabled:
+            # started on the first request so that the threads live in the (forked) uwsgi worker
+            app.before_first_request(self.start)
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"admission-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def notify(self) -> None:
+        """
+        Wake the workers up right away instead of waiting for the next poll
+        """
+        self._wakeup.set()
+
+    def submit(self, course_id: int, user_id: int) -> EnrollmentRequestModel:
+        """
+        Queue an enrollment, or return the request the user already has open for the course
+        """
+        request = EnrollmentRequestModel.find_open(course_id, user_id)
+        if request is None:
+            request = EnrollmentRequestModel(course_id, user_id)
+            try:
+                request.save_to_db()
+            except IntegrityError:  # ix_enrollment_requests_open: the same request was queued concurrently
+                db.session.rollback()
+                request = EnrollmentRequestModel.find_open(course_id, user_id)
+                if request is None:
+                    raise
+                return request
+            self.notify()
+        return request
+
+    @staticmethod
+    def pending_courses() -> List[int]:
+        """
+        Courses with queued requests, or with waitlisted requests and free slots
+        """
+        requests = EnrollmentRequestModel.__table__.c
+        courses = CourseModel.__table__.c
+        query = select([distinct(requests.course_id)]).select_from(
+            EnrollmentRequestModel.__table__.join(CourseModel.__table__, requests.course_id == courses.id)
+        ).where(or_(
+            requests.status == QUEUED,
+            and_(requests.status == WAITLISTED, or_(courses.slots.is_(None), courses.enrolled < courses.slots)),
+        ))
+        return [course_id for course_id, in db.session.execute(query)]
+
+    def process_course(self, course_id: int) -> int:
+        """
+        Handle the next batch of requests of the course in one transaction, returns how many were handled.
+        Must run inside an application context.
+        """
+        courses = CourseModel.__table__
+        requests = EnrollmentRequestModel.__table__
+        # lock the course row first: the requests of a course are handled by one worker at a time, in order
+        db.session.execute(courses.update().where(courses.c.id == course_id).values(enrolled=courses.c.enrolled))
+        slots, enrolled = db.session.execute(
+            select([courses.c.slots, courses.c.enrolled]).where(courses.c.id == course_id)
+        ).first()
+        free = None if slots is None else max(slots - enrolled, 0)
+
+        columns = select([requests.c.id, requests.c.user_id, requests.c.status]).order_by(requests.c.id)
+        batch = []
+        if free is None or free > 0:  # the waitlist goes first
+            limit = self.batch_size if free is None else min(free, self.batch_size)
+            batch += db.session.execute(columns.where(and_(
+                requests.c.course_id == course_id, requests.c.status == WAITLISTED
+            )).limit(limit).with_for_update()).fetchall()
+        batch += db.session.execute(columns.where(and_(
+            requests.c.course_id == course_id, requests.c.status == QUEUED
+        )).limit(self.batch_size).with_for_update()).fetchall()
+
+        users = {user_id for _, user_id, _ in batch}
+        already_enrolled = set()
+        if users:
+            already_enrolled.update(user_id for user_id, in db.session.execute(
+                select([association_table.c.users]).where(and_(
+                    association_table.c.courses == course_id, association_table.c.users.in_(users)
+                ))
+            ))
+
+        now = int(time())
+        enrollments, outcomes = [], []
+        for _id, user_id, status in batch:
+            if user_id in already_enrolled:
+                outcomes.append(_outcome(_id, REJECTED, "already_enrolled", now))
+            elif free is None or free > 0:
+                enrollments.append({"courses": course_id, "users": user_id})
+                already_enrolled.add(user_id)
+                outcomes.append(_outcome(_id, ENROLLED, None, now))
+                free = None if free is None else free - 1
+            elif status == QUEUED:
+                outcomes.append(_outcome(_id, WAITLISTED, None, None))
+        if enrollments:
+            db.session.execute(association_table.insert(), enrollments)
+            db.session.execute(courses.update().where(courses.c.id == course_id)
+                               .values(enrolled=courses.c.enrolled + len(enrollments)))
+        if outcomes:
+            db.session.execute(
+                requests.update().where(requests.c.id == bindparam("_id")).values(
+                    status=bindparam("_status"), reason=bindparam("_reason"), processed_at=bindparam("_processed_at")
+                ),
+                outcomes,
+            )
+        db.session.commit()
+        if enrollments:
+            CourseModel.invalidate_enrolled_cache(course_id)
+        return len(batch)
+
+    def process_once(self) -> int:
+        """
+        Handle one batch for every course with work, returns how many requests were handled.
+        Must run inside an application context.
+        """
+        handled = 0
+        for course_id in self.pending_courses():
+            try:
+                handled += self.process_course(course_id)
+            except Exception:
+                traceback.print_exc()
+                db.session.rollback()
+        return handled
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    handled = self.process_once()
+                except Exception:
+                    traceback.print_exc()
+                    db.session.rollback()
+                    handled = 0
+            if not handled:  # nothing left for now, wait for a new request or the next poll
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
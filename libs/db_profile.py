@@ -0,0 +1,77 @@
+"""
+libs.db_profile
+
+Engine profile built from the DB_* settings of the app config: connection pool sizing, pre-ping and recycle
+for server databases, a statement timeout on Postgres, and on SQLite the pragmas that let readers run alongside
+a writer (WAL) and make writers wait for the lock instead of failing at once (busy_timeout).
+"""
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+
+from db import db
+
+
+def engine_options(config) -> dict:
+    # the name of the dialect SQLAlchemy loads, e.g. "postgresql" for Heroku's postgres:// URLs too
+    backend = make_url(config["SQLALCHEMY_DATABASE_URI"]).get_dialect().name
+    options = {"pool_pre_ping": config.get("DB_POOL_PRE_PING", True)}
+    if backend == "sqlite":
+        # SQLAlchemy picks the pool for SQLite itself, it doesn't accept sizing arguments
+        return options
+    options.update(
+        pool_size=config.get("DB_POOL_SIZE", 5),
+        max_overflow=config.get("DB_MAX_OVERFLOW", 10),
+        pool_timeout=config.get("DB_POOL_TIMEOUT", 30),
+        pool_recycle=config.get("DB_POOL_RECYCLE", 1800),
+    )
+    statement_timeout = config.get("DB_STATEMENT_TIMEOUT_MS")
+    if statement_timeout and backend == "postgresql":
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+    return options
+
+
+def sqlite_pragmas(config) -> dict:
+    return {
+        "journal_mode": config.get("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": config.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": config.get("SQLITE_BUSY_TIMEOUT_MS", 5000),
+        "mmap_size": config.get("SQLITE_MMAP_SIZE", 64 * 1024 * 1024),
+    }
+
+
+def set_pragmas_on_connect(pragmas: dict, target=Engine) -> None:
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    event.listen(target, "connect", _set_sqlite_pragmas)
+
+
+def init_app(app) -> None:
+    options = engine_options(app.config)
+    options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))  # explicit options win
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+    set_pragmas_on_connect(sqlite_pragmas(app.config))
+    app.before_first_request(report)
+
+
+def report() -> None:
+    """
+    Print the settings the engine actually runs with
+    """
+    engine = db.engine
+    print(f"Database engine: {engine.url!r} pool={engine.pool.status()}")
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as connection:
+            for name in ("journal_mode", "synchronous", "busy_timeout", "mmap_size"):
+                print(f"  PRAGMA {name} = {connection.execute(f'PRAGMA {name}').scalar()}")
+    elif engine.dialect.name == "postgresql":
+        with engine.connect() as connection:
+            print(f"  statement_timeout = {connection.execute('SHOW statement_timeout').scalar()}")
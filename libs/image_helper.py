@@ -1,15 +1,192 @@
+import hashlib
+import importlib.util
 import os
 import re
-from typing import Union
+import shutil
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Union
+
+from flask import Request, current_app, request, send_file
 from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+from flask_uploads import UploadSet, UploadNotAllowed, IMAGES
 
-from flask_uploads import UploadSet, IMAGES
+PILLOW = importlib.util.find_spec("PIL") is not None  # thumbnails are skipped without Pillow, imported on first use
 
 IMAGE_SET = UploadSet("images", IMAGES)  # set name and allowed extensions
 
+CHUNK_SIZE = 64 * 1024
+SNIFF_LENGTH = 512  # bytes kept from the start of an upload to detect its type
+MAGIC_BYTES = (
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+)
+THUMBNAIL_FORMATS = {"jpg": "JPEG", "png": "PNG", "gif": "GIF", "bmp": "BMP"}
+
+max_image_bytes = 10 * 1024 * 1024
+thumbnail_sizes = (64, 256)
+thumbnail_workers = 2
+cache_max_age = 365 * 24 * 3600
+_thumbnail_pool = None
+
+
+def init_app(app) -> None:
+    global max_image_bytes, thumbnail_sizes, thumbnail_workers, cache_max_age
+    max_image_bytes = app.config.get("IMAGE_MAX_BYTES", max_image_bytes)
+    thumbnail_sizes = app.config.get("IMAGE_THUMBNAIL_SIZES", thumbnail_sizes)
+    thumbnail_workers = app.config.get("IMAGE_THUMBNAIL_WORKERS", thumbnail_workers)
+    cache_max_age = app.config.get("IMAGE_CACHE_MAX_AGE", cache_max_age)
+    app.request_class = UploadRequest
+
+
+class HashingSpool:
+    """
+    Writable file that the multipart parser streams an upload into. It spools to a temporary file next to the
+    image store, hashes and counts the bytes as they arrive, keeps the first bytes for type sniffing, and aborts
+    with 413 as soon as the upload grows over `max_image_bytes`.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=directory, prefix=".upload-", delete=False)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.size > max_image_bytes:
+            self.close()
+            raise RequestEntityTooLarge()
+        if len(self.head) < SNIFF_LENGTH:
+            self.head += data[:SNIFF_LENGTH - len(self.head)]
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def close(self) -> None:
+        """
+        Called when the request ends, removes the spool file unless save_image moved it into the store
+        """
+        self.file.close()
+        if os.path.exists(self.file.name):
+            os.remove(self.file.name)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length and total_content_length > max_image_bytes:  # reject before reading the body
+            raise RequestEntityTooLarge()
+        return HashingSpool(os.path.join(IMAGE_SET.config.destination, ".incoming"))
+
+
+def sniff_extension(head: bytes) -> Union[str, None]:
+    """
+    Detect the image type from its first bytes, regardless of the extension the client sent
+    """
+    for magic, extension in MAGIC_BYTES:
+        if head.startswith(magic):
+            return extension
+    text = head.lstrip().lower()
+    if text.startswith(b"<svg") or (text.startswith(b"<?xml") and b"<svg" in text):
+        return "svg"
+    return None
+
 
 def save_image(image: FileStorage, folder: str = None, name: str = None) -> str:
-    return IMAGE_SET.save(image, folder, name)
+    """
+    Store the image content-addressed (by sha256) so that identical uploads share one file on disk, and link it
+    into `folder` under the uploaded (or given) name. Thumbnails are generated in the background.
+    Returns the path relative to the upload set, like UploadSet.save.
+    """
+    spool = image.stream if isinstance(image.stream, HashingSpool) else _spool(image)
+    try:
+        extension = sniff_extension(spool.head)
+        if extension is None:
+            raise UploadNotAllowed()
+        digest = spool.sha256.hexdigest()
+        blob = blob_path(digest, extension)
+        spool.file.close()
+        if os.path.exists(blob):  # duplicate upload
+            spool.close()
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(spool.file.name, blob)
+            _submit_thumbnails(blob, digest, extension)
+    except Exception:
+        spool.close()
+        raise
+
+    stem = os.path.splitext(secure_filename(name or image.filename or ""))[0] or digest[:16]
+    basename = f"{stem}.{extension}"
+    target_folder = os.path.join(IMAGE_SET.config.destination, folder) if folder else IMAGE_SET.config.destination
+    os.makedirs(target_folder, exist_ok=True)
+    target = os.path.join(target_folder, basename)
+    if os.path.exists(target) and not os.path.samefile(target, blob):
+        basename = IMAGE_SET.resolve_conflict(target_folder, basename)
+        target = os.path.join(target_folder, basename)
+    if not os.path.exists(target):
+        _link(blob, target)
+    image_index.add(folder, basename, digest)
+    return os.path.join(folder, basename) if folder else basename
+
+
+def blob_path(digest: str, extension: str, size: int = None) -> str:
+    suffix = f"_{size}" if size else ""
+    return os.path.join(IMAGE_SET.config.destination, "blobs", digest[:2], f"{digest}{suffix}.{extension}")
+
+
+def _spool(image: FileStorage) -> HashingSpool:
+    # uploads that did not go through UploadRequest (e.g. built by hand) are spooled here
+    spool = HashingSpool(os.path.join(IMAGE_SET.config.destination, ".incoming"))
+    image.stream.seek(0)
+    for chunk in iter(lambda: image.stream.read(CHUNK_SIZE), b""):
+        spool.write(chunk)
+    return spool
+
+
+def _link(source: str, target: str) -> None:
+    try:
+        os.link(source, target)  # no extra disk space
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def _submit_thumbnails(blob: str, digest: str, extension: str) -> None:
+    global _thumbnail_pool
+    if not PILLOW or extension not in THUMBNAIL_FORMATS or not thumbnail_workers:
+        return
+    if _thumbnail_pool is None:  # created lazily, so that each (forked) uwsgi worker gets its own pool
+        _thumbnail_pool = ThreadPoolExecutor(max_workers=thumbnail_workers, thread_name_prefix="thumbnails")
+    # paths are resolved here, the upload set configuration needs the application context
+    targets = {size: blob_path(digest, extension, size) for size in thumbnail_sizes}
+    _thumbnail_pool.submit(make_thumbnails, blob, targets, THUMBNAIL_FORMATS[extension])
+
+
+def make_thumbnails(blob: str, targets: dict, image_format: str) -> None:
+    from PIL import Image
+
+    try:
+        for size, target in targets.items():
+            if os.path.exists(target):
+                continue
+            with Image.open(blob) as original:
+                original.thumbnail((size, size))
+                partial = f"{target}.part"
+                original.save(partial, image_format)
+                os.replace(partial, target)  # never expose a half written thumbnail
+    except Exception:
+        traceback.print_exc()
 
 
 def get_path(filename: str = None, folder: str = None) -> str:
@@ -18,18 +195,107 @@ def get_path(filename: str = None, folder: str = None) -> str:
 
 def find_image_any_format(filename: str, folder: str) -> Union[str, None]:
     """
-    Given a format-less filename, try to find the file by appending each of the allowed formats to the given
-    filename and check if the file exists
+    Given a format-less filename, find the stored file with any of the allowed formats
     :param filename: formatless filename
     :param folder: the relative folder in which to search
     :return: the path of the image if exists, otherwise None
     """
-    for _format in IMAGES:  # look for existing avatar and delete it
-        avatar = f"{filename}.{_format}"
-        avatar_path = IMAGE_SET.path(filename=avatar, folder=folder)
-        if os.path.isfile(avatar_path):
-            return avatar_path
-    return None
+    found = image_index.lookup(folder, filename)
+    return IMAGE_SET.path(filename=found[0], folder=folder) if found else None
+
+
+class ImageIndex:
+    """
+    Per-folder index of the stored images, by file name and by format-less name, to (basename, sha256).
+    A folder is listed once, the first time it is looked up, and save_image keeps its index current, so
+    resolving a name is a dict lookup. Stored files are never overwritten, an index can only miss images
+    saved by another process: a miss lists the folder again.
+    """
+
+    def __init__(self):
+        self._folders = {}  # folder -> (files, stems)
+        self._lock = threading.Lock()
+
+    def lookup(self, folder: str, name: str) -> Optional[Tuple[str, str]]:
+        entries = self._folders.get(folder)
+        found = _find(entries, name)
+        if found is None:
+            found = _find(self._scan(folder), name)
+        return found
+
+    def add(self, folder: str, basename: str, digest: str) -> None:
+        with self._lock:
+            entries = self._folders.get(folder)
+            if entries is not None:
+                _index(entries, basename, digest)
+
+    def _scan(self, folder: str) -> tuple:
+        with self._lock:
+            known = self._folders.get(folder, ({}, {}))[0]
+            entries = ({}, {})
+            directory = os.path.join(IMAGE_SET.config.destination, folder or "")
+            if os.path.isdir(directory):
+                for entry in os.scandir(directory):
+                    if entry.name.startswith(".") or not entry.is_file():
+                        continue
+                    digest = known[entry.name][1] if entry.name in known else _file_digest(entry.path)
+                    _index(entries, entry.name, digest)
+            self._folders[folder] = entries
+            return entries
+
+
+def _find(entries: Optional[tuple], name: str) -> Optional[Tuple[str, str]]:
+    if entries is None:
+        return None
+    files, stems = entries
+    return files.get(name) or stems.get(name)
+
+
+def _index(entries: tuple, basename: str, digest: str) -> None:
+    files, stems = entries
+    stem, extension = os.path.splitext(basename)
+    files[basename] = (basename, digest)
+    current = stems.get(stem)
+    # same precedence as probing the formats in the order of IMAGES
+    if current is None or _precedence(extension) < _precedence(os.path.splitext(current[0])[1]):
+        stems[stem] = (basename, digest)
+
+
+def _precedence(extension: str) -> int:
+    extension = extension.lstrip(".").lower()
+    return IMAGES.index(extension) if extension in IMAGES else len(IMAGES)
+
+
+def _file_digest(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+image_index = ImageIndex()
+
+
+def send_image(path: str, etag: str):
+    """
+    Response streaming the file at `path` (with sendfile where the server supports it, or an X-Sendfile header
+    when USE_X_SENDFILE is set), answering If-None-Match and Range requests. Stored images never change, `etag`
+    is derived from their content and they can be cached for `cache_max_age`.
+    """
+    response = send_file(path, add_etags=False, cache_timeout=cache_max_age)
+    response.set_etag(etag)
+    response.cache_control.public = False
+    response.cache_control.private = True  # served to the authenticated owner only
+    response.headers["Cache-Control"] += ", immutable"
+    # with X-Sendfile the front-end server sends the body and handles ranges itself
+    use_x_sendfile = current_app.use_x_sendfile
+    response = response.make_conditional(
+        request, accept_ranges=not use_x_sendfile, complete_length=None if use_x_sendfile else os.path.getsize(path)
+    )
+    if response.status_code == 304:
+        response.headers.pop("X-Sendfile", None)
+    return response
 
 
 def _retrieve_filename(file: Union[str, FileStorage]) -> str:
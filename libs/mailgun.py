@@ -1,9 +1,13 @@
+import json
 import os
-from typing import List
+import threading
+from typing import TYPE_CHECKING, Dict, List
 
-from dotenv import load_dotenv
-from requests import Response, post
 from libs.strings import gettext
+from metrics import metrics
+
+if TYPE_CHECKING:  # requests is only imported when the first e-mail is sent
+    from requests import Response, Session
 
 
 class MailGunException(Exception):
@@ -12,35 +16,100 @@ class MailGunException(Exception):
 
 
 class Mailgun:
-    load_dotenv(".env", verbose=True)
     MAILGUN_API_KEY = os.environ.get("MAILGUN_API_KEY", None)
     MAILGUN_DOMAIN = os.environ.get("MAILGUN_DOMAIN", None)
+    MAILGUN_API_URL = os.environ.get("MAILGUN_API_URL", "https://api.mailgun.net/v3")  # or a local stand-in
 
     FROM_TITLE = "Play Health Club"
     FROM_EMAIL = f"do-not-reply@{MAILGUN_DOMAIN}"
 
+    # (connect, read) seconds, a stalled Mailgun must not hold an outbox worker
+    TIMEOUT = (
+        float(os.environ.get("MAILGUN_CONNECT_TIMEOUT", 3.05)),
+        float(os.environ.get("MAILGUN_READ_TIMEOUT", 10)),
+    )
+    POOL_SIZE = int(os.environ.get("MAILGUN_POOL_SIZE", 10))
+    BATCH_SIZE = 1000  # most recipients Mailgun accepts in one message
+
+    _session = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_session(cls) -> "Session":
+        """
+        The keep-alive session, with a pool of `POOL_SIZE` connections, built on first use
+        """
+        if cls._session is None:
+            with cls._lock:
+                if cls._session is None:
+                    from requests import Session
+                    from requests.adapters import HTTPAdapter
+
+                    session = Session()
+                    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=cls.POOL_SIZE))
+                    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=cls.POOL_SIZE))
+                    cls._session = session
+        return cls._session
+
     @classmethod
     def send_email(
         cls, email: List[str], subject: str, text: str, html: str
-    ) -> Response:
+    ) -> "Response":
+        return cls._post({
+            "from": f"{cls.FROM_TITLE} <{cls.FROM_EMAIL}>",
+            "to": email,
+            "subject": subject,
+            "text": text,
+            "html": html,
+        })
+
+    @classmethod
+    def send_batch(
+        cls, recipients: Dict[str, dict], subject: str, text: str, html: str = None
+    ) -> List["Response"]:
+        """
+        Send one message to many members, `BATCH_SIZE` recipients per request. `recipients` maps each address to
+        its recipient variables, which the contents reference as `%recipient.<name>%`; every member only sees
+        their own address.
+        """
+        responses = []
+        addresses = list(recipients)
+        for start in range(0, len(addresses), cls.BATCH_SIZE):
+            batch = addresses[start:start + cls.BATCH_SIZE]
+            data = {
+                "from": f"{cls.FROM_TITLE} <{cls.FROM_EMAIL}>",
+                "to": batch,
+                "subject": subject,
+                "text": text,
+                "recipient-variables": json.dumps({address: recipients[address] for address in batch}),
+            }
+            if html:
+                data["html"] = html
+            responses.append(cls._post(data))
+        return responses
+
+    @classmethod
+    def _post(cls, data: dict) -> "Response":
         if cls.MAILGUN_API_KEY is None:
             raise MailGunException(gettext("mailgun_failed_load_api_key"))
 
         if cls.MAILGUN_DOMAIN is None:
             raise MailGunException(gettext("mailgun_failed_load_domain"))
-        response = post(
-            f"https://api.mailgun.net/v3/{cls.MAILGUN_DOMAIN}/messages",
-            auth=("api", cls.MAILGUN_API_KEY),
-            data={
-                "from": f"{cls.FROM_TITLE} <{cls.FROM_EMAIL}>",
-                "to": email,
-                "subject": subject,
-                "text": text,
-                "html": html,
-            },
-        )
+        session = cls.get_session()
+        from requests import RequestException
+
+        with metrics.timer("outbound_request_duration_seconds", provider="mailgun"):
+            try:
+                response = session.post(
+                    f"{cls.MAILGUN_API_URL}/{cls.MAILGUN_DOMAIN}/messages",
+                    auth=("api", cls.MAILGUN_API_KEY),
+                    data=data,
+                    timeout=cls.TIMEOUT,
+                )
+            except RequestException as e:  # timeouts and connection errors are retried like failed sends
+                raise MailGunException(gettext("mailgun_error_connection").format(e))
         if response.status_code != 200:
             # print(response.status_code)
-            print(response.json())
+            print(response.text)
             raise MailGunException(gettext("mailgun_error_send_email"))
         return response
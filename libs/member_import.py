@@ -0,0 +1,250 @@
+"""
+libs.member_import
+
+Bulk import of club members (ids are the member numbers of the club system) from CSV or NDJSON, through
+`POST /users/import` (staff tokens only, see ADMIN_USER_IDS) or `flask import-members FILE`.
+
+The input is streamed and handled `batch_size` records per transaction: one query each for the existing ids,
+e-mails and phones of the batch, then executemany inserts of the new users and their confirmations, and
+executemany updates of the known ones. An update only writes the columns present in the record, a CSV without
+a `phone` column or an NDJSON object without a "phone" key leaves the phones as they are. A batch that clashes
+with a member registered meanwhile is retried once. New members get no password, they set it through
+`PUT /register` as before. With `notify`, their confirmation e-mails and sms are queued in the outbox in the
+same transaction and delivered later by the outbox workers; the import never waits on Mailgun or Twilio.
+"""
+import csv
+import io
+import json
+from datetime import date
+from random import randint
+from time import perf_counter, time
+from typing import IO, Iterator, Tuple, Union
+from uuid import uuid4
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError
+
+from cache import cache
+from db import db
+from models.confirmation import ConfirmationModel
+from models.outbox import OutboxModel, PENDING
+from models.user import UserModel
+from outbox import outbox
+
+FIELDS = ("id", "email", "phone", "name", "birth_date", "gender")
+FORMATS = ("csv", "ndjson")
+MAX_REPORTED_ERRORS = 100
+
+
+def read_records(stream: IO[str], fmt: str) -> Iterator[Tuple[int, Union[dict, str]]]:
+    """
+    (line number, record) of a CSV (with a header line) or NDJSON text stream, NDJSON records are the raw lines
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if line.strip():
+                yield line_number, line
+
+
+def clean(record: Union[dict, str]) -> dict:
+    """
+    The user columns present in a record, an empty value clears its column. Raises ValueError when the record
+    can't be imported.
+    """
+    if isinstance(record, str):
+        record = json.loads(record)
+    if not isinstance(record, dict):
+        raise ValueError("a record must be an object")
+    if not record.get("id") or not record.get("email"):
+        raise ValueError("id and email are required")
+    # a short CSV line has None for its missing cells, like a missing key
+    values = {field: str(record[field]).strip() or None for field in FIELDS if record.get(field) is not None}
+    values["id"] = int(values["id"])
+    if values.get("birth_date"):
+        values["birth_date"] = date.fromisoformat(values["birth_date"])
+    if values.get("gender") and len(values["gender"]) != 1:
+        raise ValueError("gender must be one character")
+    return values
+
+
+class MemberImport:
+    def __init__(self, batch_size: int = 1000, notify: bool = False, url_root: str = None,
+                 confirmation_expiration: int = 7 * 24 * 3600):
+        self.batch_size = batch_size
+        self.notify = notify
+        self.url_root = url_root
+        self.confirmation_expiration = confirmation_expiration
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.rejected = 0
+
+    def run(self, stream: IO[str], fmt: str) -> dict:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown import format '{fmt}'")
+        start = perf_counter()
+        batch = []
+        try:
+            for line_number, record in read_records(stream, fmt):
+                try:
+                    batch.append((line_number, clean(record)))
+                except (ValueError, TypeError) as e:
+                    self.reject(line_number, str(e))
+                if len(batch) >= self.batch_size:
+                    self.import_batch(batch)
+                    batch = []
+        except (csv.Error, UnicodeDecodeError) as e:  # unreadable input, the batches before it are kept
+            self.reject(None, str(e))
+        if batch:
+            self.import_batch(batch)
+        if self.notify and self.created:
+            outbox.notify()
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "seconds": round(perf_counter() - start, 3),
+        }
+
+    def reject(self, line_number, reason: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "reason": reason})
+
+    def import_batch(self, batch: list) -> None:
+        for attempt in range(2):
+            try:
+                created, updated, rejected = self.write_batch(batch)
+                break
+            except IntegrityError as e:  # a member registered with one of the ids, e-mails or phones meanwhile
+                db.session.rollback()
+                if attempt:
+                    for line_number, _ in batch:
+                        self.reject(line_number, f"conflicts with a concurrent change: {e.orig}")
+                    return
+        for line_number, reason in rejected:
+            self.reject(line_number, reason)
+        self.created += created
+        self.updated += updated
+
+    def write_batch(self, batch: list) -> Tuple[int, int, list]:
+        """
+        Insert and update the members of a batch in one transaction, returns (created, updated, rejections)
+        """
+        users = {}  # id -> values, the last record of an id in the batch wins
+        for line_number, values in batch:
+            users[values["id"]] = (line_number, values)
+        ids = list(users)
+        existing = {_id for _id, in db.session.query(UserModel.id).filter(UserModel.id.in_(ids))}
+        # unique columns already used by other members, or by an earlier record of this batch
+        taken = {}
+        for column in ("email", "phone"):
+            wanted = [values[column] for _, values in users.values() if values.get(column)]
+            taken[column] = dict(db.session.query(getattr(UserModel, column), UserModel.id).filter(
+                getattr(UserModel, column).in_(wanted)
+            )) if wanted else {}
+
+        created, updated, rejected = [], {}, []
+        for _id, (line_number, values) in users.items():
+            conflict = next((column for column in ("email", "phone")
+                             if values.get(column) and taken[column].get(values[column], _id) != _id), None)
+            if conflict:
+                rejected.append((line_number, f"{conflict} {values[conflict]} belongs to another member"))
+                continue
+            for column in ("email", "phone"):
+                if values.get(column):
+                    taken[column][values[column]] = _id
+            if _id in existing:
+                updated.setdefault(tuple(field for field in FIELDS if field in values), []).append(values)
+            else:
+                created.append({field: values.get(field) for field in FIELDS})
+
+        if created:
+            db.session.execute(UserModel.__table__.insert(), created)
+            self.confirm(created)
+        table = UserModel.__table__
+        for fields, rows in updated.items():  # one executemany per set of columns present
+            db.session.execute(
+                table.update().where(table.c.id == bindparam("_id")).values(
+                    {field: bindparam(f"_{field}") for field in fields if field != "id"}
+                ),
+                [{f"_{field}": values[field] for field in fields} for values in rows],
+            )
+        renamed = [values["id"] for fields, rows in updated.items() if "name" in fields for values in rows]
+        rosters = UserModel.roster_namespaces(*renamed) if renamed else []
+        db.session.commit()
+        cache.invalidate_namespace(*rosters)
+        return len(created), sum(len(rows) for rows in updated.values()), rejected
+
+    def confirm(self, users: list) -> None:
+        """
+        Insert a confirmation for each new member, and queue its notifications with `notify`
+        """
+        now = int(time())
+        confirmations = [{
+            "id": uuid4().hex,
+            "code": randint(1000, 9999),
+            "expire_at": now + self.confirmation_expiration,
+            "confirmed": False,
+            "user_id": values["id"],
+        } for values in users]
+        db.session.execute(ConfirmationModel.__table__.insert(), confirmations)
+        if not self.notify:
+            return
+        messages = []
+        for values, confirmation in zip(users, confirmations):
+            contents = UserModel.confirmation_email(self.url_root, confirmation["id"])
+            messages.append(self.message("email", values["email"], contents, values["id"], now))
+            if values["phone"]:
+                contents = UserModel.confirmation_sms(confirmation["code"])
+                number = UserModel.sms_number(values["phone"])
+                messages.append(self.message("sms", number, contents, values["id"], now))
+        db.session.execute(OutboxModel.__table__.insert(), messages)
+
+    @staticmethod
+    def message(channel: str, recipient: str, contents: dict, user_id: int, now: int) -> dict:
+        return {
+            "channel": channel,
+            "recipient": recipient,
+            "payload": json.dumps(contents),
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+            "user_id": user_id,
+        }
+
+
+def import_members(stream: IO[str], fmt: str, notify: bool = False, url_root: str = None) -> dict:
+    config = current_app.config
+    return MemberImport(
+        batch_size=config.get("IMPORT_BATCH_SIZE", 1000),
+        notify=notify,
+        url_root=url_root,
+        confirmation_expiration=config.get("IMPORT_CONFIRMATION_EXPIRATION", 7 * 24 * 3600),
+    ).run(stream, fmt)
+
+
+@click.command("import-members")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="defaults to the file extension")
+@click.option("--notify", is_flag=True, help="queue the confirmation e-mails and sms of the new members")
+@click.option("--url-root", default="http://localhost:5000", help="scheme and host of the confirmation links")
+@with_appcontext
+def import_members_command(path: str, fmt: str, notify: bool, url_root: str):
+    """
+    Create or update the members listed in a CSV or NDJSON file
+    """
+    fmt = fmt or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+    with current_app.test_request_context(base_url=url_root):  # the confirmation links are built with url_for
+        with io.open(path, newline="", encoding="utf-8") as stream:
+            report = import_members(stream, fmt, notify, url_root.rstrip("/"))
+    click.echo(json.dumps(report, indent=2))
@@ -0,0 +1,176 @@
+"""
+libs.metrics
+
+Prometheus-style instrumentation: per-resource request latency, SQL statements and time per request (from
+SQLAlchemy cursor events), requests over the `METRICS_QUERY_BUDGET` (likely N+1 queries), outbound
+Mailgun/Twilio call latency and scheduled job durations.
+
+Each process keeps its own counters and histograms. Under uwsgi every worker publishes a snapshot to the shared
+`metrics` cache (see uwsgi.ini) after its requests, at most every `METRICS_PUBLISH_INTERVAL` seconds, and
+`/metrics` sums the snapshots of all workers, so the numbers don't depend on which worker answers the scrape.
+"""
+import json
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter, time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+HELP = {
+    "http_request_duration_seconds": ("histogram", "Request latency by resource, method and status."),
+    "db_statements_total": ("counter", "SQL statements executed by resource."),
+    "db_statement_seconds_total": ("counter", "Time spent executing SQL statements by resource."),
+    "db_query_budget_exceeded_total": ("counter", "Requests that executed more statements than the query budget."),
+    "outbound_request_duration_seconds": ("histogram", "Latency of outbound Mailgun/Twilio calls."),
+    "scheduled_job_duration_seconds": ("histogram", "Duration of the scheduled jobs by outcome."),
+}
+
+
+def _labels(labels: dict) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.counters = defaultdict(float)  # "name|labels" -> value
+        self.histograms = {}  # "name|labels" -> bucket counts followed by sum and count
+        self.query_budget = 20
+        self.publish_interval = 1.0
+        self.app = None
+        self.uwsgi = None
+        self._next_publish = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.query_budget = app.config.get("METRICS_QUERY_BUDGET", 20)
+        self.publish_interval = app.config.get("METRICS_PUBLISH_INTERVAL", 1.0)
+        try:
+            import uwsgi  # only importable when running under uwsgi
+
+            self.uwsgi = uwsgi
+        except ImportError:
+            pass
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+        event.listen(Engine, "before_cursor_execute", self._start_statement)
+        event.listen(Engine, "after_cursor_execute", self._end_statement)
+
+    def inc(self, name: str, labels: dict, value: float = 1.0) -> None:
+        with self._lock:
+            self.counters[f"{name}|{_labels(labels)}"] += value
+
+    def observe(self, name: str, labels: dict, value: float) -> None:
+        key = f"{name}|{_labels(labels)}"
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self.observe(name, dict(labels, outcome=outcome), perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"counters": dict(self.counters), "histograms": {k: list(v) for k, v in self.histograms.items()}}
+
+    def publish(self) -> None:
+        if self.uwsgi is not None:
+            self.uwsgi.cache_update(f"worker:{self.uwsgi.worker_id()}", json.dumps(self.snapshot()), 0, "metrics")
+        self._next_publish = time() + self.publish_interval
+
+    def collect(self) -> list:
+        """
+        Snapshots of every worker (only this process when not running under uwsgi)
+        """
+        self.publish()
+        if self.uwsgi is None:
+            return [self.snapshot()]
+        snapshots = []
+        for worker in self.uwsgi.workers():
+            value = self.uwsgi.cache_get(f"worker:{worker['id']}", "metrics")
+            if value is not None:
+                snapshots.append(json.loads(value))
+        return snapshots
+
+    def render(self) -> str:
+        counters = defaultdict(float)
+        histograms = {}
+        for snapshot in self.collect():
+            for key, value in snapshot["counters"].items():
+                counters[key] += value
+            for key, values in snapshot["histograms"].items():
+                merged = histograms.setdefault(key, [0] * len(values))
+                for i, value in enumerate(values):
+                    merged[i] += value
+
+        lines = []
+        for name, (kind, description) in HELP.items():
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            for key in sorted(counters):
+                if key.split("|")[0] == name:
+                    lines.append(f"{name}{{{key.split('|')[1]}}} {counters[key]}")
+            for key in sorted(histograms):
+                if key.split("|")[0] == name:
+                    labels = key.split("|")[1]
+                    values = histograms[key]
+                    for bound, count in zip(BUCKETS, values):
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {values[-1]}')
+                    lines.append(f"{name}_sum{{{labels}}} {values[-2]}")
+                    lines.append(f"{name}_count{{{labels}}} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def _start_request(self) -> None:
+        g.metrics_start = perf_counter()
+        g.metrics_statements = 0
+        g.metrics_statement_seconds = 0.0
+
+    def _end_request(self, response):
+        if "metrics_start" not in g:
+            return response
+        view = self.app.view_functions.get(request.endpoint)
+        resource = getattr(view, "view_class", view).__name__ if view else "unmatched"
+        self.observe(
+            "http_request_duration_seconds",
+            {"resource": resource, "method": request.method, "status": response.status_code},
+            perf_counter() - g.metrics_start,
+        )
+        self.inc("db_statements_total", {"resource": resource}, g.metrics_statements)
+        self.inc("db_statement_seconds_total", {"resource": resource}, g.metrics_statement_seconds)
+        if g.metrics_statements > self.query_budget:
+            self.inc("db_query_budget_exceeded_total", {"resource": resource})
+            self.app.logger.warning(
+                f"{request.method} {request.path} ({resource}) executed {g.metrics_statements} SQL statements, "
+                f"over the budget of {self.query_budget}"
+            )
+        if time() >= self._next_publish:
+            self.publish()
+        return response
+
+    def _start_statement(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            g.metrics_statement_start = perf_counter()
+
+    def _end_statement(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and "metrics_statements" in g:
+            g.metrics_statements += 1
+            g.metrics_statement_seconds += perf_counter() - g.get("metrics_statement_start", perf_counter())
@@ -0,0 +1,83 @@
+"""
+libs.migrations
+
+Brings a database created by an earlier version of the app up to the current models. `db.create_all()` creates
+the missing tables but never alters the existing ones, so `upgrade()`, run by run.py on startup:
+- adds courses.enrolled, the per-course enrollment counter;
+- rebuilds the association table with its (courses, users) primary key, dropping duplicate enrollments;
+- creates the indexes declared on the existing tables (e.g. ix_courses_timetable), expiring the duplicate open
+  enrollment requests before ix_enrollment_requests_open;
+and then recomputes the enrollment counters when the column or the enrollments changed. Every step checks the
+schema first, so nothing is done on an up to date database. On Postgres the steps run in one transaction under
+an advisory lock, so that processes starting together (e.g. several dynos) upgrade the database once.
+"""
+from time import time
+
+from sqlalchemy import and_, exists, inspect, text
+
+from db import db
+from models.course import CourseModel, association_table
+from models.enrollment_request import EnrollmentRequestModel, EXPIRED, OPEN
+
+UPGRADE_LOCK = 520017  # pg_advisory_xact_lock key held while upgrading
+
+
+def upgrade() -> list:
+    """
+    Apply the missing changes and return their names. Must run inside an application context.
+    """
+    applied = []
+    with db.engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), key=UPGRADE_LOCK)
+        inspector = inspect(connection)  # inspected under the lock, after any other process upgraded
+        tables = set(inspector.get_table_names())
+        if "courses" in tables and "enrolled" not in {column["name"] for column in inspector.get_columns("courses")}:
+            connection.execute(text("ALTER TABLE courses ADD COLUMN enrolled INTEGER DEFAULT 0 NOT NULL"))
+            applied.append("courses.enrolled")
+        if "association" in tables and not inspector.get_pk_constraint("association")["constrained_columns"]:
+            rebuild_association(connection)
+            applied.append("association primary key")
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                continue  # created with its indexes by db.create_all()
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    if index.name == "ix_enrollment_requests_open":
+                        expire_duplicate_requests(connection)
+                    index.create(connection)
+                    applied.append(index.name)
+    if {"courses.enrolled", "association primary key"} & set(applied):
+        CourseModel.recount()
+    return applied
+
+
+def rebuild_association(connection) -> None:
+    """
+    Copy the enrollments, once each, into a new association table with the primary key of the model
+    """
+    connection.execute(text("ALTER TABLE association RENAME TO association_old"))
+    association_table.create(connection)
+    connection.execute(text(
+        "INSERT INTO association (courses, users) SELECT DISTINCT courses, users FROM association_old "
+        "WHERE courses IS NOT NULL AND users IS NOT NULL"
+    ))
+    connection.execute(text("DROP TABLE association_old"))
+
+
+def expire_duplicate_requests(connection) -> None:
+    """
+    Keep the first open request of every member and course, so that ix_enrollment_requests_open can be created
+    """
+    requests = EnrollmentRequestModel.__table__
+    earlier = requests.alias("earlier")
+    connection.execute(
+        requests.update().where(and_(
+            requests.c.status.in_(OPEN),
+            exists().where(and_(
+                earlier.c.course_id == requests.c.course_id, earlier.c.user_id == requests.c.user_id,
+                earlier.c.status.in_(OPEN), earlier.c.id < requests.c.id,
+            )),
+        )).values(status=EXPIRED, processed_at=int(time()))
+    )
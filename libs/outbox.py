@@ -0,0 +1,135 @@
+"""
+libs.outbox
+
+Background delivery of the messages queued in the `outbox` table.
+
+Requests only insert an `OutboxModel` row; a pool of worker threads per process claims due messages in
+batches, hands them to a provider and records the outcome, retrying failures with exponential backoff.
+Claims are leased in the database, so pools running in several uwsgi workers never deliver the same message.
+Set `OUTBOX_PROVIDER = "fake"` to deliver to `FakeProvider` instead of Mailgun/Twilio, for offline load tests.
+"""
+import threading
+import traceback
+from random import random
+from time import sleep
+from typing import List
+
+from db import db
+from libs.mailgun import Mailgun, MailGunException
+from libs.twilio import Twilio, TwilioException
+from models.outbox import OutboxModel
+
+
+class LiveProvider:
+    def deliver(self, message: OutboxModel) -> None:
+        contents = message.contents
+        if message.channel == "email":
+            Mailgun.send_email([message.recipient], contents["subject"], contents["text"], contents["html"])
+        elif message.channel == "sms":
+            Twilio.send_sms(number=message.recipient, body=contents["body"])
+        elif message.channel == "bulk":  # one e-mail to many members, see CourseAnnouncement
+            Mailgun.send_batch(contents["recipients"], contents["subject"], contents["text"], contents.get("html"))
+        else:
+            raise ValueError(f"Unknown outbox channel '{message.channel}'")
+
+
+class FakeProvider:
+    """
+    Records deliveries in memory instead of calling the providers, optionally simulating latency and failures
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.delivered = []
+        self._lock = threading.Lock()
+
+    def deliver(self, message: OutboxModel) -> None:
+        if self.latency:
+            sleep(self.latency)
+        if random() < self.failure_rate:
+            raise MailGunException("Simulated delivery failure")
+        with self._lock:
+            self.delivered.append((message.channel, message.recipient, message.contents))
+
+
+class OutboxDispatcher:
+    def __init__(self):
+        self.app = None
+        self.provider = None
+        self.workers = 0
+        self.batch_size = 20
+        self.max_attempts = 5
+        self.poll_interval = 1.0
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.workers = app.config.get("OUTBOX_WORKERS", 2)
+        self.batch_size = app.config.get("OUTBOX_BATCH_SIZE", 20)
+        self.max_attempts = app.config.get("OUTBOX_MAX_ATTEMPTS", 5)
+        self.poll_interval = app.config.get("OUTBOX_POLL_INTERVAL", 1.0)
+        if app.config.get("OUTBOX_PROVIDER", "live") == "fake":
+            self.provider = FakeProvider()
+        else:
+            self.provider = LiveProvider()
+        # started on the first request so that the threads live in the (forked) uwsgi worker
+        app.before_first_request(self.start)
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def notify(self) -> None:
+        """
+        Wake the workers up right away instead of waiting for the next poll
+        """
+        self._wakeup.set()
+
+    def dispatch_once(self) -> int:
+        """
+        Claim and deliver one batch of due messages, returns how many were claimed.
+        Must run inside an application context.
+        """
+        messages = OutboxModel.claim_batch(self.batch_size)
+        token = messages[0].claimed_by if messages else None  # read before a commit reloads the rows
+        for message in messages:
+            if not message.renew_claim(token):
+                continue
+            try:
+                self.provider.deliver(message)
+                message.mark_sent()
+            except (MailGunException, TwilioException) as e:
+                message.mark_failed(str(e), self.max_attempts)
+            except Exception as e:
+                traceback.print_exc()
+                message.mark_failed(repr(e), self.max_attempts)
+            db.session.commit()  # recorded right away, a crash later in the batch never sends it again
+        return len(messages)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    claimed = self.dispatch_once()
+                except Exception:
+                    traceback.print_exc()
+                    db.session.rollback()
+                    claimed = 0
+            if claimed < self.batch_size:  # nothing left for now, wait for a new message or the next poll
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
@@ -0,0 +1,143 @@
+"""
+libs.response_cache
+
+Read-through cache for the JSON bodies of the read-heavy course endpoints.
+
+Entries are stored already serialised together with their ETag, so a hit costs one backend lookup and no
+query or marshmallow work, and clients sending `If-None-Match` get a 304. Two backends are available:
+`LRUBackend` keeps entries in the worker's memory and `UWSGIBackend` uses a uwsgi cache shared by all workers
+(see `cache2` in uwsgi.ini). Models invalidate the keys they affect whenever they write. Responses that vary
+with the query string (e.g. pages of a list) are cached under a namespace, which is invalidated as a whole by
+switching it to a new generation.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+from uuid import uuid4
+
+from flask import current_app, request
+
+from libs import serialization
+
+ETAG_LENGTH = 32  # md5 hex digest
+
+
+class LRUBackend:
+    def __init__(self, max_items: int = 1024):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+class UWSGIBackend:
+    def __init__(self, name: str = "responses"):
+        import uwsgi  # only importable when running under uwsgi
+
+        self.uwsgi = uwsgi
+        self.name = name
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.uwsgi.cache_get(key, self.name)
+
+    def set(self, key: str, value: bytes) -> None:
+        # silently skipped by uwsgi when the value is bigger than the cache blocksize
+        self.uwsgi.cache_update(key, value, 0, self.name)
+
+    def delete(self, key: str) -> None:
+        self.uwsgi.cache_del(key, self.name)
+
+    def clear(self) -> None:
+        self.uwsgi.cache_clear(self.name)
+
+
+class ResponseCache:
+    def __init__(self, backend=None):
+        self.backend = backend or LRUBackend()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        backend = app.config.get("RESPONSE_CACHE_BACKEND", "lru")
+        if backend == "uwsgi":
+            try:
+                self.backend = UWSGIBackend(app.config.get("RESPONSE_CACHE_NAME", "responses"))
+                return
+            except ImportError:
+                app.logger.warning("uwsgi is not available, falling back to the in-process response cache")
+        self.backend = LRUBackend(app.config.get("RESPONSE_CACHE_SIZE", 1024))
+
+    def cached(self, key: str, producer: Callable[[], Tuple[dict, int]], namespace: str = None):
+        """
+        Return the cached response for `key`, calling `producer` to build it on a miss.
+        Only 200 responses are cached, anything else is returned as produced.
+        """
+        if namespace is not None:
+            key = f"{namespace}:{self._generation(namespace)}:{key}"
+        entry = self.backend.get(key)
+        if entry is None:
+            self._count(hit=False)
+            data, status = producer()
+            if status != 200:
+                return data, status
+            body = serialization.dumps(data) if serialization.enabled else json.dumps(data).encode()
+            entry = hashlib.md5(body).hexdigest().encode() + body
+            self.backend.set(key, entry)
+        else:
+            self._count(hit=True)
+        response = current_app.response_class(entry[ETAG_LENGTH:], mimetype="application/json")
+        response.set_etag(entry[:ETAG_LENGTH].decode())
+        return response.make_conditional(request)
+
+    def invalidate(self, *keys: str) -> None:
+        for key in keys:
+            self.backend.delete(key)
+
+    def invalidate_namespace(self, *namespaces: str) -> None:
+        for namespace in namespaces:
+            self.backend.set(f"{namespace}:generation", uuid4().hex.encode())
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _generation(self, namespace: str) -> str:
+        generation = self.backend.get(f"{namespace}:generation")
+        if generation is None:
+            # never fall back to a fixed value, entries of an evicted generation must not become visible again
+            generation = uuid4().hex.encode()
+            self.backend.set(f"{namespace}:generation", generation)
+        return generation.decode()
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
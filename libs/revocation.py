@@ -0,0 +1,110 @@
+"""
+libs.revocation
+
+Store of the revoked (logged out) JWT ids.
+
+Every authenticated request asks whether its token was revoked, so lookups are served from a per-worker
+in-memory mirror and never hit the database. With the database backend, revocations are written to the
+`revoked_tokens` table and each worker pulls the rows added since its last sync at most every
+`REVOCATION_SYNC_INTERVAL` seconds, which makes a logout visible to all uwsgi workers within that delay.
+Rows are pulled by insertion time, not by id, re-reading the last `SYNC_OVERLAP` seconds every time: ids are
+reused on SQLite once pruned and may commit out of order on Postgres, and a row inserted by a transaction that
+committed late, or by a host whose clock is a little behind, is still seen. Entries are dropped once the token
+they revoke has expired.
+"""
+import threading
+from time import time
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from db import db
+from models.revoked_token import RevokedTokenModel
+
+PRUNE_INTERVAL = 300  # seconds between deletions of expired rows from the database
+SYNC_OVERLAP = 60  # seconds of revocations read again by every sync
+
+
+class MemoryBackend:
+    """
+    Keeps revocations in the local mirror only, for single-process deployments and tests
+    """
+
+    def add(self, jti: str, expire_at: Optional[int]) -> None:
+        pass
+
+    def changes(self, since: float) -> list:
+        return []
+
+    def prune(self, now: int) -> None:
+        pass
+
+
+class DatabaseBackend:
+    def __init__(self):
+        self.table = RevokedTokenModel.__table__
+
+    def add(self, jti: str, expire_at: Optional[int]) -> None:
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(self.table.insert().values(jti=jti, expire_at=expire_at, created_at=time()))
+        except IntegrityError:  # already revoked
+            pass
+
+    def changes(self, since: float) -> list:
+        """
+        (jti, expire_at) of the revocations added at or after `since`
+        """
+        columns = self.table.c
+        query = select([columns.jti, columns.expire_at]).where(columns.created_at >= since)
+        return db.engine.execute(query).fetchall()
+
+    def prune(self, now: int) -> None:
+        with db.engine.begin() as connection:
+            connection.execute(self.table.delete().where(self.table.c.expire_at < now))
+
+
+class RevocationStore:
+    def __init__(self):
+        self.backend = MemoryBackend()
+        self.sync_interval = 1.0
+        self._tokens = {}  # jti -> expire_at
+        self._last_sync = 0.0  # time of the last pull from the backend
+        self._next_sync = 0.0
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        if app.config.get("REVOCATION_BACKEND", "memory") == "database":
+            self.backend = DatabaseBackend()
+        self.sync_interval = app.config.get("REVOCATION_SYNC_INTERVAL", 1.0)
+
+    def add(self, jti: str, expire_at: Optional[int] = None) -> None:
+        self.backend.add(jti, expire_at)
+        with self._lock:  # not lost to a prune rebuilding the mirror meanwhile
+            self._tokens[jti] = expire_at
+
+    def __contains__(self, jti: str) -> bool:
+        if time() >= self._next_sync:
+            self.sync()
+        return jti in self._tokens
+
+    def sync(self) -> None:
+        """
+        Pull the revocations made by other workers and drop the expired ones
+        """
+        with self._lock:
+            now = time()
+            if now < self._next_sync:  # another thread synced meanwhile
+                return
+            for jti, expire_at in self.backend.changes(self._last_sync - SYNC_OVERLAP):
+                self._tokens[jti] = expire_at
+            self._last_sync = now
+            if now >= self._next_prune:
+                self._tokens = {
+                    jti: expire_at for jti, expire_at in self._tokens.items() if expire_at is None or expire_at >= now
+                }
+                self.backend.prune(int(now))
+                self._next_prune = now + PRUNE_INTERVAL
+            self._next_sync = now + self.sync_interval
@@ -0,0 +1,123 @@
+"""
+libs.scheduler
+
+Runs the scheduled jobs (Config.JOBS) from the uwsgi workers.
+
+Every worker runs an APScheduler, started on its first request, but only the one holding the lease row in
+`scheduler_leases` executes the jobs: the holder renews it every third of `SCHEDULER_LEASE_SECONDS`, and when it
+stops doing so (the worker died or was recycled) another worker takes the lease over once it has expired. Job
+arguments are evaluated when the job runs, and every execution is recorded in `job_runs` and in the
+`scheduled_job_duration_seconds` metric.
+"""
+import os
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from time import perf_counter
+from uuid import uuid4
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+
+from db import db
+from metrics import metrics
+from models.job_run import JobRunModel
+from models.scheduler_lease import SchedulerLeaseModel
+
+LEASE_NAME = "jobs"
+
+
+class JobScheduler:
+    def __init__(self):
+        self.app = None
+        self.jobs = {}  # job id -> job definition, as in Config.JOBS
+        self.lease_seconds = 60
+        self.holder = None
+        self._scheduler = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, jobs: list) -> None:
+        self.app = app
+        self.jobs = {job["id"]: job for job in jobs}
+        self.lease_seconds = app.config.get("SCHEDULER_LEASE_SECONDS", 60)
+        if app.config.get("SCHEDULER_MODE", "off") == "leader":
+            # started on the first request so that the scheduler thread lives in the (forked) uwsgi worker
+            app.before_first_request(self.start)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._scheduler is not None:
+                return
+            with self.app.app_context():  # the jobs may run before the first request created the tables
+                for model in (SchedulerLeaseModel, JobRunModel):
+                    model.__table__.create(db.engine, checkfirst=True)
+            self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+            from flask_apscheduler import APScheduler  # only the workers that start a scheduler pay for its import
+
+            self._scheduler = APScheduler()
+            self._scheduler.init_app(self.app)
+            for job_id, job in self.jobs.items():
+                options = {key: value for key, value in job.items() if key not in ("id", "func", "args", "kwargs")}
+                self._scheduler.add_job(job_id, self.run_job, args=(job_id,), **options)
+            self._scheduler.add_job(
+                "scheduler_lease", self.acquire, trigger="interval", seconds=max(1, self.lease_seconds // 3)
+            )
+            self._scheduler.start()
+
+    def shutdown(self) -> None:
+        if self._scheduler is not None and self._scheduler.running:
+            self._scheduler.shutdown(wait=False)
+
+    def acquire(self) -> bool:
+        """
+        Take or renew the lease, returns whether this worker holds it
+        """
+        table = SchedulerLeaseModel.__table__
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        try:
+            with self.app.app_context(), db.engine.begin() as connection:
+                renewed = connection.execute(
+                    table.update()
+                    .where(and_(
+                        table.c.name == LEASE_NAME,
+                        or_(table.c.holder == self.holder, table.c.expires_at < now),
+                    ))
+                    .values(holder=self.holder, expires_at=expires_at)
+                ).rowcount
+            if renewed:
+                return True
+            with self.app.app_context(), db.engine.begin() as connection:  # first worker ever, the lease row doesn't exist yet
+                connection.execute(table.insert().values(name=LEASE_NAME, holder=self.holder, expires_at=expires_at))
+            return True
+        except IntegrityError:  # another worker holds the lease
+            return False
+
+    def run_job(self, job_id: str) -> None:
+        if not self.acquire():
+            return
+        job = self.jobs[job_id]
+        started_at = datetime.utcnow()
+        start = perf_counter()
+        outcome = "success"
+        try:
+            with self.app.app_context():
+                result = job["func"](*job.get("args", ()), **job.get("kwargs", {}))
+        except Exception as e:
+            traceback.print_exc()
+            outcome = "error"
+            result = repr(e)
+        duration = perf_counter() - start
+        print(f"Job {job_id} finished with {outcome} in {duration:.3f}s")
+        metrics.observe("scheduled_job_duration_seconds", {"job": job_id, "outcome": outcome}, duration)
+        metrics.publish()
+        with self.app.app_context(), db.engine.begin() as connection:
+            connection.execute(JobRunModel.__table__.insert().values(
+                job_id=job_id,
+                holder=self.holder,
+                started_at=started_at,
+                duration=duration,
+                outcome=outcome,
+                result=None if result is None else str(result)[:255],
+            ))
@@ -1,25 +1,173 @@
 """
 libs.strings
 
-By default, uses `en-gb.json` file inside the `strings` top-level folder.
+Messages of every locale found in the `strings` top-level folder (`<locale>.json`), `en-gb` being the default.
 
-If language changes, set `libs.strings.default_locale` and run `libs.strings.refresh()`.
+All the files are read once into a `Catalog` that is never modified afterwards. Each locale is completed with
+the default messages when the catalog is built, so `gettext` is a single dict lookup. With `init_app`, the
+locale of every request is chosen from its `Accept-Language` header, and responses tell it back through
+`Content-Language`; outside of a request the default locale is used.
+
+The catalog is built by `init_app`, i.e. in the uwsgi master, so the forked workers share its pages until a
+worker reloads it. With STRINGS_RELOAD_INTERVAL, each worker checks the files that often and swaps in a new
+catalog when they changed: a request keeps the catalog it started with, and a file that fails to load leaves
+the current catalog in place. `refresh()` rebuilds it right away.
 """
 import json
+import os
+import threading
+import traceback
+from time import sleep
+from types import MappingProxyType
+from typing import Dict, Mapping, Tuple
+
+from flask import g, request
+from werkzeug.datastructures import LanguageAccept
+from werkzeug.http import parse_accept_header
 
 default_locale = "en-gb"
-cached_strings = {}
+folder = "strings"
+MAX_NEGOTIATED_HEADERS = 256  # distinct Accept-Language values remembered per catalog
+
+
+class Catalog:
+    """
+    The messages of all the locales, read-only
+    """
+
+    def __init__(self, messages: Dict[str, dict], default: str, stamp: tuple = ()):
+        if default not in messages:
+            raise ValueError(f"No strings for the default locale '{default}'")
+        self.default = default
+        self.stamp = stamp  # the files it was built from, see file_stamp
+        self.locales: Mapping[str, Mapping[str, str]] = MappingProxyType({
+            locale: MappingProxyType({**messages[default], **strings}) for locale, strings in messages.items()
+        })
+        aliases = {}
+        for locale in sorted(messages):  # e.g. "pt" picks the first of the "pt-*" locales
+            aliases.setdefault(locale.split("-")[0], locale)
+        aliases.update((locale, locale) for locale in messages)
+        self.aliases = MappingProxyType(aliases)
+        self._negotiated = {}  # Accept-Language header -> locale
+
+    @classmethod
+    def load(cls, path: str, default: str) -> "Catalog":
+        stamp = file_stamp(path)
+        messages = {}
+        for filename, _, _ in stamp:
+            with open(os.path.join(path, filename), encoding="utf-8") as f:
+                messages[filename[:-len(".json")].lower()] = json.load(f)
+        return cls(messages, default, stamp)
+
+    def negotiate(self, header: str) -> str:
+        """
+        The locale that best matches an Accept-Language header, or the default one
+        """
+        locale = self._negotiated.get(header)
+        if locale is None:
+            locale = self.default
+            for language, _ in parse_accept_header(header, LanguageAccept):  # by decreasing quality
+                language = language.lower().replace("_", "-")
+                match = self.aliases.get(language) or self.aliases.get(language.split("-")[0])
+                if match:
+                    locale = match
+                    break
+            if len(self._negotiated) < MAX_NEGOTIATED_HEADERS:
+                self._negotiated[header] = locale
+        return locale
+
+
+def file_stamp(path: str) -> Tuple[Tuple[str, int, int], ...]:
+    """
+    (name, mtime, size) of the locale files, changes whenever a file is added, removed or written
+    """
+    with os.scandir(path) as entries:
+        return tuple(sorted(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in entries if entry.name.endswith(".json") and entry.is_file()
+        ))
+
+
+_catalog: Catalog = None
+_lock = threading.Lock()
+_request = threading.local()  # strings of the request being handled by the thread, cheaper to reach than `g`
+
+
+def catalog() -> Catalog:
+    if _catalog is None:
+        refresh()
+    return _catalog
 
 
-def refresh():
-    print("Refreshing...")
-    global cached_strings
-    with open(f"strings/{default_locale}.json") as f:
-        cached_strings = json.load(f)
+def refresh() -> None:
+    """
+    Build a new catalog from the files and swap it in
+    """
+    global _catalog
+    with _lock:
+        _catalog = Catalog.load(folder, default_locale)
 
 
 def gettext(name):
-    return cached_strings[name]
+    strings = getattr(_request, "strings", None)
+    if strings is None:
+        current = catalog()
+        strings = current.locales[current.default]
+    return strings[name]
+
+
+def init_app(app) -> None:
+    global default_locale, folder
+    default_locale = app.config.get("STRINGS_DEFAULT_LOCALE", default_locale)
+    folder = app.config.get("STRINGS_FOLDER", folder)
+    refresh()
+    app.before_request(_select_locale)
+    app.after_request(_content_language)
+    app.teardown_request(_reset_locale)
+    interval = app.config.get("STRINGS_RELOAD_INTERVAL", 0)
+    if interval:
+        # started on the first request so that the thread lives in the (forked) uwsgi worker
+        app.before_first_request(lambda: _start_watcher(interval))
+
+
+def _select_locale() -> None:
+    current = catalog()
+    g.locale = current.negotiate(request.headers.get("Accept-Language", ""))
+    _request.strings = current.locales[g.locale]
+
+
+def _content_language(response):
+    if "locale" in g and len(catalog().locales) > 1:
+        response.headers["Content-Language"] = g.locale
+        response.vary.add("Accept-Language")
+    return response
+
+
+def _reset_locale(_exception) -> None:
+    _request.strings = None
+
+
+_watcher: threading.Thread = None
+
+
+def _start_watcher(interval: float) -> None:
+    global _watcher
+    with _lock:
+        if _watcher is not None:
+            return
+        _watcher = threading.Thread(target=_watch, args=(interval,), name="strings-reload", daemon=True)
+        _watcher.start()
 
 
-refresh()
+def _watch(interval: float) -> None:
+    stamp = catalog().stamp
+    while True:
+        sleep(interval)
+        try:
+            changed = file_stamp(folder)
+            if changed == stamp:
+                continue
+            stamp = changed  # a broken file is reported once, not on every check
+            refresh()
+        except Exception:
+            traceback.print_exc()
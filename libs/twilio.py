@@ -1,9 +1,14 @@
 import os
-from dotenv import load_dotenv
-from twilio.rest import Client
-from twilio.rest.api.v2010.account.message import MessageInstance
+import threading
+from typing import TYPE_CHECKING
 
 from libs.strings import gettext
+from metrics import metrics
+
+if TYPE_CHECKING:  # the twilio SDK is only imported when the first sms is sent
+    from twilio.http.http_client import TwilioHttpClient
+    from twilio.rest import Client
+    from twilio.rest.api.v2010.account.message import MessageInstance
 
 twilio_phone_number = ''
 
@@ -13,28 +18,75 @@ class TwilioException(Exception):
         super().__init__(message)
 
 
+def _http_client(pool_size: int, timeout: tuple) -> "TwilioHttpClient":
+    """
+    Keep-alive session with a pool of `pool_size` connections and (connect, read) timeouts
+    """
+    from requests.adapters import HTTPAdapter
+    from twilio.http.http_client import TwilioHttpClient
+
+    http_client = TwilioHttpClient(pool_connections=True)
+    http_client.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    http_client.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    http_client.timeout = timeout  # the constructor only accepts a single number
+    return http_client
+
+
 class Twilio:
-    load_dotenv(".env", verbose=True)
     TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID", None)
     TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN", None)
-    client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-    
+    TWILIO_API_URL = os.environ.get("TWILIO_API_URL", None)  # a local stand-in instead of api.twilio.com
+
+    # (connect, read) seconds, a stalled Twilio must not hold an outbox worker
+    TIMEOUT = (
+        float(os.environ.get("TWILIO_CONNECT_TIMEOUT", 3.05)),
+        float(os.environ.get("TWILIO_READ_TIMEOUT", 10)),
+    )
+    POOL_SIZE = int(os.environ.get("TWILIO_POOL_SIZE", 10))
+
+    _client = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_client(cls) -> "Client":
+        """
+        The REST client, built on first use: importing the SDK takes longer than importing the rest of the app
+        """
+        if cls._client is None:
+            with cls._lock:
+                if cls._client is None:
+                    from twilio.rest import Client
+
+                    client = Client(cls.TWILIO_ACCOUNT_SID, cls.TWILIO_AUTH_TOKEN,
+                                    http_client=_http_client(cls.POOL_SIZE, cls.TIMEOUT))
+                    if cls.TWILIO_API_URL:
+                        client.api.base_url = cls.TWILIO_API_URL
+                    cls._client = client
+        return cls._client
+
     @classmethod
     def send_sms(
             cls, number: str, body: str,
-    ) -> MessageInstance:
+    ) -> "MessageInstance":
         if cls.TWILIO_ACCOUNT_SID is None:
             raise TwilioException(gettext("twilio_failed_load_account_sid"))
 
         if cls.TWILIO_AUTH_TOKEN is None:
             raise TwilioException(gettext("twilio_failed_load_auth_token"))
 
-        response: MessageInstance = cls.client.messages.create(
-            from_=twilio_phone_number,
-            body=body,
-            to=number
-        )
+        client = cls.get_client()
+        from requests import RequestException
+        from twilio.base.exceptions import TwilioRestException
+
+        with metrics.timer("outbound_request_duration_seconds", provider="twilio"):
+            try:
+                response = client.messages.create(
+                    from_=twilio_phone_number,
+                    body=body,
+                    to=number
+                )
+            except (RequestException, TwilioRestException) as e:  # retried like failed sends
+                raise TwilioException(gettext("twilio_error_request").format(e))
         if response.status != 'queued':
             raise TwilioException(gettext("twilio_error_send_sms"))
         return response
-
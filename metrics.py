@@ -0,0 +1,3 @@
+from libs.metrics import MetricsRegistry
+
+metrics = MetricsRegistry()
@@ -2,17 +2,22 @@ from random import randint
 from time import time
 from uuid import uuid4
 
+from sqlalchemy import and_, event, exists, or_, select
+from sqlalchemy.orm import Session, aliased
+
 from db import db
 
 CONFIRMATION_EXPIRATION_DELTA = 1800  # 30 minutes
+CONFIRMATION_PURGE_BATCH = 500  # rows deleted per transaction by purge
 
 
 class ConfirmationModel(db.Model):
     __tablename__ = "confirmations"
+    __table_args__ = (db.Index("ix_confirmations_user_expire_at", "user_id", "expire_at"),)
 
     id = db.Column(db.String(50), primary_key=True)
     code = db.Column(db.Integer, nullable=False)
-    expire_at = db.Column(db.Integer, nullable=False)
+    expire_at = db.Column(db.Integer, nullable=False, index=True)
     confirmed = db.Column(db.Boolean, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     user = db.relationship("UserModel")
@@ -38,6 +43,39 @@ class ConfirmationModel(db.Model):
             self.expire_at = int(time())
             self.save_to_db()
 
+    @classmethod
+    def purge(cls, from_job=False) -> int:
+        """
+        Delete the expired unconfirmed confirmations, and every confirmed one but the latest of each user,
+        CONFIRMATION_PURGE_BATCH rows per transaction so that no lock is held for long. The latest confirmation
+        of a user is always kept, it is the one UserModel.most_recent_confirmation reports.
+        Returns the number of rows deleted.
+        """
+        start = time()
+        newer = aliased(cls)
+        is_newer = and_(
+            newer.user_id == cls.user_id,
+            or_(newer.expire_at > cls.expire_at, and_(newer.expire_at == cls.expire_at, newer.id > cls.id)),
+        )
+        stale = or_(
+            and_(cls.confirmed.is_(False), cls.expire_at < int(start), exists().where(is_newer)),
+            and_(cls.confirmed.is_(True), exists().where(and_(is_newer, newer.confirmed.is_(True)))),
+        )
+        removed = 0
+        with db.app.app_context():
+            while True:
+                batch = select([cls.id]).where(stale).limit(CONFIRMATION_PURGE_BATCH)
+                ids = [_id for _id, in db.session.execute(batch)]
+                if ids:
+                    db.session.execute(cls.__table__.delete().where(cls.id.in_(ids)))
+                    db.session.commit()
+                    removed += len(ids)
+                if len(ids) < CONFIRMATION_PURGE_BATCH:
+                    break
+        if from_job:
+            print('Purged {} confirmations in {:.2f}s'.format(removed, time() - start))
+        return removed
+
     def save_to_db(self) -> None:
         db.session.add(self)
         db.session.commit()
@@ -45,3 +83,15 @@ class ConfirmationModel(db.Model):
     def delete_from_db(self) -> None:
         db.session.delete(self)
         db.session.commit()
+
+
+@event.listens_for(Session, "after_flush")
+def _forget_recent_confirmations(session, flush_context):
+    """
+    Drop the memoized UserModel.most_recent_confirmation of every user whose confirmations were just written
+    """
+    recent = session.info.get("most_recent_confirmation")
+    if recent:
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(instance, ConfirmationModel):
+                recent.pop(instance.user_id, None)
@@ -1,17 +1,26 @@
 from datetime import datetime
-from typing import List
+from typing import List, Tuple
 
+from sqlalchemy import and_, bindparam, exists, false, func, literal, not_, or_, select, true
+
+from cache import cache
 from db import db
+from models.enrollment_request import EnrollmentRequestModel
+from models.user import UserModel
+from utils.datetime_converter import str_to_time
 
+# (courses, users) is the primary key, so a user can only be enrolled once per course and membership checks
+# are an index seek; the extra index on users covers lookups from the user side
 association_table = db.Table('association', db.Model.metadata,
-                             db.Column('courses', db.Integer, db.ForeignKey('courses.id')),
-                             db.Column('users', db.Integer, db.ForeignKey('users.id')))
+                             db.Column('courses', db.Integer, db.ForeignKey('courses.id'), primary_key=True),
+                             db.Column('users', db.Integer, db.ForeignKey('users.id'), primary_key=True,
+                                       index=True))
 
 week_list = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday']
 
-
 class CourseModel(db.Model):
     __tablename__ = "courses"
+    __table_args__ = (db.Index("ix_courses_timetable", "day_week", "start_time", "id"),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False, unique=False)
@@ -22,6 +31,8 @@ class CourseModel(db.Model):
     year = db.Column(db.Integer)
     day_week = db.Column(db.Integer)
     slots = db.Column(db.Integer)
+    # number of rows in the association table for this course, maintained by the enrollment methods below
+    enrolled = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     @classmethod
     def find_by_id(cls, _id: int) -> "CourseModel":
@@ -35,40 +46,281 @@ class CourseModel(db.Model):
     def find_all(cls) -> List["CourseModel"]:
         return cls.query.all()
 
+    @classmethod
+    def find_rows(cls, _id: int = None, name: str = None) -> list:
+        """
+        Courses as column rows, by id or by name
+        """
+        query = db.session.query(*cls.__table__.columns)
+        return query.filter(cls.id == _id if _id is not None else cls.name == name).all()
+
     @classmethod
     def find_by_day(cls, day: int) -> List["CourseModel"]:
         return cls.query.filter_by(day_week=day).all()
 
+    @classmethod
+    def find_page(cls, limit: int, after: list = None, day_week: int = None, location: str = None,
+                  month: int = None, year: int = None, name_prefix: str = None) -> list:
+        """
+        Return up to `limit` courses as column rows (no ORM instances), ordered by (day_week, start_time, id)
+        and starting after the `after` key, the [day_week, 'HH:MM:SS', id] of the last row of the previous page
+        (null for a missing day_week or start_time). Both the filter and the order are on the raw columns, so
+        that the database walks ix_courses_timetable instead of sorting the table for every page.
+        """
+        query = db.session.query(*cls.__table__.columns)
+        if day_week is not None:
+            query = query.filter(cls.day_week == day_week)
+        if location is not None:
+            query = query.filter(cls.location == location)
+        if month is not None:
+            query = query.filter(cls.month == month)
+        if year is not None:
+            query = query.filter(cls.year == year)
+        if name_prefix:
+            query = query.filter(cls.name.startswith(name_prefix, autoescape=True))
+        if after:
+            day, start, _id = after
+            start = str_to_time(start) if start is not None else None
+            nulls_first = db.session.get_bind().dialect.name != "postgresql"  # where ASC puts the NULLs
+            query = query.filter(_after(
+                (cls.day_week, cls.start_time, cls.id), (day, start, int(_id)), nulls_first
+            ))
+        return query.order_by(cls.day_week, cls.start_time, cls.id).limit(limit).all()
+
+    @classmethod
+    def find_timetable(cls) -> list:
+        """
+        Return every course as a column row with its enrolled count, ordered by (day_week, start_time, id)
+        """
+        return db.session.query(
+            cls.id, cls.name, cls.location, cls.day_week, cls.start_time, cls.slots, cls.enrolled
+        ).order_by(cls.day_week, cls.start_time, cls.id).all()
+
+    @classmethod
+    def page_key(cls, row) -> list:
+        start_time = row.start_time.strftime('%H:%M:%S') if row.start_time is not None else None
+        return [row.day_week, start_time, row.id]
+
+    def find_enrolled_page(self, limit: int, after: int = None, name_prefix: str = None) -> list:
+        """
+        Return up to `limit` (id, name) rows of the enrolled users with an id greater than `after`
+        """
+        query = db.session.query(UserModel.id, UserModel.name).join(
+            association_table, association_table.c.users == UserModel.id
+        ).filter(association_table.c.courses == self.id)
+        if after is not None:
+            query = query.filter(UserModel.id > after)
+        if name_prefix:
+            query = query.filter(UserModel.name.startswith(name_prefix, autoescape=True))
+        return query.order_by(UserModel.id).limit(limit).all()
+
+    def find_recipients(self) -> list:
+        """
+        Return the (id, name, email) rows of all the enrolled users, to message them
+        """
+        return db.session.query(UserModel.id, UserModel.name, UserModel.email).join(
+            association_table, association_table.c.users == UserModel.id
+        ).filter(association_table.c.courses == self.id).order_by(UserModel.id).all()
+
     def save_to_db(self) -> None:
         db.session.add(self)
         db.session.commit()
+        self.invalidate_cache()
 
     def delete_from_db(self) -> None:
         db.session.delete(self)
         db.session.commit()
+        self.invalidate_cache()
+
+    def invalidate_cache(self) -> None:
+        cache.invalidate(f"course:{self.id}", f"course_name:{self.name}")
+        cache.invalidate_namespace("courses")
+        self.invalidate_enrolled_cache(self.id)
 
-    def enroll_user(self, user) -> None:
-        self.users.append(user)
-        self.save_to_db()
+    @classmethod
+    def invalidate_enrolled_cache(cls, *ids: int) -> None:
+        cache.invalidate_namespace("timetable", *(f"enrolled:{_id}" for _id in ids))
+
+    def _enrollment(self, user):
+        return and_(association_table.c.courses == self.id, association_table.c.users == user.id)
 
-    def disenroll_user(self, user) -> None:
-        self.users.remove(user)
-        self.save_to_db()
+    def is_enrolled(self, user) -> bool:
+        return db.session.query(exists().where(self._enrollment(user))).scalar()
 
-    def clear_users(self):
-        self.users.clear()
-        self.save_to_db()
+    def enroll_user(self, user) -> bool:
+        """
+        Enroll the user if the course still has free slots and the user is not enrolled yet, otherwise
+        return False. A slot is taken by a conditional UPDATE of the `enrolled` counter, which also locks the
+        course row until the commit, and the enrollment is inserted unless it exists, in one transaction.
+        """
+        courses = CourseModel.__table__
+        reserved = db.session.execute(
+            courses.update().where(and_(
+                courses.c.id == self.id,
+                or_(courses.c.slots.is_(None), courses.c.enrolled < courses.c.slots),
+            )).values(enrolled=courses.c.enrolled + 1)
+        ).rowcount
+        inserted = reserved and db.session.execute(
+            association_table.insert().from_select(
+                ["courses", "users"],
+                select([literal(self.id), literal(user.id)]).where(not_(exists().where(self._enrollment(user)))),
+            )
+        ).rowcount
+        if inserted != 1:
+            db.session.rollback()  # gives the slot back
+            return False
+        db.session.commit()
+        self.invalidate_enrolled_cache(self.id)
+        return True
+
+    def disenroll_user(self, user) -> bool:
+        removed = db.session.execute(association_table.delete().where(self._enrollment(user))).rowcount
+        if removed:
+            self._update_counter(CourseModel.id == self.id, CourseModel.enrolled - removed)
+        db.session.commit()
+        self.invalidate_enrolled_cache(self.id)
+        return removed == 1
+
+    def clear_users(self) -> int:
+        removed = db.session.execute(
+            association_table.delete().where(association_table.c.courses == self.id)
+        ).rowcount
+        self._update_counter(CourseModel.id == self.id, 0)
+        db.session.commit()
+        self.invalidate_enrolled_cache(self.id)
+        return removed
+
+    @classmethod
+    def _update_counter(cls, condition, value) -> None:
+        db.session.execute(cls.__table__.update().where(condition).values(enrolled=value))
 
     @classmethod
-    def clear_all(cls, day=None, from_job=False):
-        if day != 6:
-            if from_job and day is not None:
-                print('Clearing enrolled users in {}'.format(week_list[day].capitalize()))
-            with db.app.app_context():
-                if day is None:
-                    for course in cls.find_all():
-                        course.clear_users()
+    def apply_batch(cls, operations: List[dict]) -> Tuple[List[str], dict]:
+        """
+        Apply many {"action": "enroll" | "disenroll", "user_id", "course_id"} operations in one transaction,
+        in order, respecting the slots. Users, courses and current enrollments are each read with one query
+        after locking the courses, and the changes are written with one insert, one delete and one counter
+        update per course. Returns an outcome per operation ("enrolled", "disenrolled", "user_not_found",
+        "course_not_found", "already_enrolled", "course_full" or "not_enrolled") and the courses by id.
+        """
+        course_ids = {operation["course_id"] for operation in operations}
+        user_ids = {operation["user_id"] for operation in operations}
+        courses_table = cls.__table__
+        # lock the courses, as enroll_user does, so the slot checks hold until the commit
+        db.session.execute(
+            courses_table.update().where(courses_table.c.id.in_(course_ids)).values(enrolled=courses_table.c.enrolled)
+        )
+        courses = {row.id: row for row in db.session.query(*courses_table.columns).filter(cls.id.in_(course_ids))}
+        users = {_id for _id, in db.session.query(UserModel.id).filter(UserModel.id.in_(user_ids))}
+        initial = {tuple(row) for row in db.session.execute(
+            select([association_table.c.courses, association_table.c.users]).where(and_(
+                association_table.c.courses.in_(course_ids), association_table.c.users.in_(user_ids)
+            ))
+        )}
+
+        members = set(initial)
+        counts = {_id: course.enrolled for _id, course in courses.items()}
+        outcomes = []
+        for operation in operations:
+            course_id, user_id = operation["course_id"], operation["user_id"]
+            pair = (course_id, user_id)
+            course = courses.get(course_id)
+            if user_id not in users:
+                outcomes.append("user_not_found")
+            elif course is None:
+                outcomes.append("course_not_found")
+            elif operation["action"] == "disenroll":
+                if pair not in members:
+                    outcomes.append("not_enrolled")
                 else:
-                    for course in cls.find_by_day(day):
-                        course.clear_users()
+                    members.discard(pair)
+                    counts[course_id] -= 1
+                    outcomes.append("disenrolled")
+            elif pair in members:
+                outcomes.append("already_enrolled")
+            elif course.slots is not None and counts[course_id] >= course.slots:
+                outcomes.append("course_full")
+            else:
+                members.add(pair)
+                counts[course_id] += 1
+                outcomes.append("enrolled")
+
+        added = [{"courses": course_id, "users": user_id} for course_id, user_id in members - initial]
+        removed = [{"_courses": course_id, "_users": user_id} for course_id, user_id in initial - members]
+        if added:
+            db.session.execute(association_table.insert(), added)
+        if removed:
+            db.session.execute(association_table.delete().where(and_(
+                association_table.c.courses == bindparam("_courses"), association_table.c.users == bindparam("_users")
+            )), removed)
+        changed = [{"_id": _id, "_enrolled": count} for _id, count in counts.items() if count != courses[_id].enrolled]
+        if changed:
+            db.session.execute(
+                courses_table.update().where(courses_table.c.id == bindparam("_id")).values(
+                    enrolled=bindparam("_enrolled")
+                ),
+                changed,
+            )
+        db.session.commit()
+        cls.invalidate_enrolled_cache(*{course_id for course_id, _ in members ^ initial})
+        return outcomes, courses
+
+    @classmethod
+    def recount(cls) -> None:
+        """
+        Recompute the enrolled counters from the association table, e.g. after adding the column to an
+        existing database
+        """
+        enrolled = select([func.count()]).where(association_table.c.courses == cls.id).as_scalar()
+        cls._update_counter(true(), enrolled)
+        db.session.commit()
+        cache.invalidate_namespace("timetable")
+
+    @classmethod
+    def clear_all(cls, day=None, from_job=False) -> int:
+        """
+        Remove every enrollment (or only the ones for courses on the given weekday) with a single
+        DELETE on the association table and reset their counters, in one transaction. Open admission
+        requests for those courses expire. Returns the number of enrollments removed.
+        """
+        if day == 6:
+            return 0
+        if from_job and day is not None:
+            print('Clearing enrolled users in {}'.format(week_list[day].capitalize()))
+        query = association_table.delete()
+        courses = select([cls.id])
+        if day is not None:
+            courses = courses.where(cls.day_week == day)
+            query = query.where(association_table.c.courses.in_(courses))
+        with db.app.app_context():
+            removed = db.session.execute(query).rowcount
+            cls._update_counter(true() if day is None else cls.day_week == day, 0)
+            EnrollmentRequestModel.expire(courses)  # the waitlists don't carry over to next week's class
+            db.session.commit()
+            cls.invalidate_enrolled_cache(*(_id for _id, in db.session.execute(courses)))
+        if from_job:
+            print('Removed {} enrollments'.format(removed))
+        return removed
+
+    @classmethod
+    def clear_today(cls, from_job=False) -> int:
+        """
+        clear_all for the weekday the job runs on
+        """
+        return cls.clear_all(datetime.today().weekday(), from_job)
+
 
+def _after(columns: tuple, key: tuple, nulls_first: bool):
+    """
+    Keyset predicate: the rows that come after `key` in the ascending order of `columns`, whose values may be
+    NULL (sorted first or last, see `nulls_first`). Each column gets a plain range on the indexed column, with
+    explicit IS NULL branches, so that the index stays usable for both the filter and the order.
+    """
+    column, value = columns[0], key[0]
+    rest = _after(columns[1:], key[1:], nulls_first) if len(columns) > 1 else false()
+    if value is None:
+        later = column.isnot(None) if nulls_first else false()
+        return or_(later, and_(column.is_(None), rest))
+    later = column > value if nulls_first else or_(column > value, column.is_(None))
+    bound = column >= value if nulls_first else or_(column >= value, column.is_(None))
+    return and_(bound, or_(later, and_(column == value, rest)))
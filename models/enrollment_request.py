@@ -0,0 +1,98 @@
+from time import time
+from uuid import uuid4
+
+from sqlalchemy import and_, func, text
+
+from db import db
+
+QUEUED = "queued"
+WAITLISTED = "waitlisted"
+ENROLLED = "enrolled"
+REJECTED = "rejected"
+CANCELLED = "cancelled"
+EXPIRED = "expired"
+OPEN = (QUEUED, WAITLISTED)
+OPEN_CLAUSE = text(f"status IN ('{QUEUED}', '{WAITLISTED}')")  # predicate of the partial unique index
+
+
+class EnrollmentRequestModel(db.Model):
+    """
+    An enrollment made in admission mode: queued by EnrollUser, then enrolled, waitlisted or rejected in
+    order of arrival by the admission workers (see libs.admission). Clients poll it by its ticket.
+    """
+    __tablename__ = "enrollment_requests"
+    __table_args__ = (
+        db.Index("ix_enrollment_requests_course_status", "course_id", "status", "id"),
+        # one open request per member and course, however many times EnrollUser is called
+        db.Index("ix_enrollment_requests_open", "course_id", "user_id", unique=True,
+                 postgresql_where=OPEN_CLAUSE, sqlite_where=OPEN_CLAUSE),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)  # arrival order
+    ticket = db.Column(db.String(32), nullable=False, unique=True)
+    course_id = db.Column(db.Integer, db.ForeignKey("courses.id", ondelete="CASCADE"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    status = db.Column(db.String(10), nullable=False, default=QUEUED)
+    reason = db.Column(db.String(40), nullable=True)  # why a request was rejected
+    created_at = db.Column(db.Integer, nullable=False)
+    processed_at = db.Column(db.Integer, nullable=True)
+
+    def __init__(self, course_id: int, user_id: int, **kwargs):
+        super().__init__(**kwargs)
+        self.course_id = course_id
+        self.user_id = user_id
+        self.ticket = uuid4().hex
+        self.status = QUEUED
+        self.created_at = int(time())
+
+    @classmethod
+    def find_by_ticket(cls, ticket: str) -> "EnrollmentRequestModel":
+        return cls.query.filter_by(ticket=ticket).first()
+
+    @classmethod
+    def find_open(cls, course_id: int, user_id: int) -> "EnrollmentRequestModel":
+        return cls.query.filter(and_(
+            cls.course_id == course_id, cls.user_id == user_id, cls.status.in_(OPEN)
+        )).first()
+
+    @property
+    def position(self):
+        """
+        1-based place among the requests of the course waiting with the same status, None once processed
+        """
+        if self.status not in OPEN:
+            return None
+        cls = type(self)
+        return db.session.query(func.count(cls.id)).filter(and_(
+            cls.course_id == self.course_id, cls.status == self.status, cls.id < self.id
+        )).scalar() + 1
+
+    @classmethod
+    def expire(cls, courses) -> None:
+        """
+        Close the open requests of `courses` (a select of course ids), when their enrollments are cleared.
+        Runs in the caller's transaction.
+        """
+        db.session.execute(
+            cls.__table__.update()
+            .where(and_(cls.course_id.in_(courses), cls.status.in_(OPEN)))
+            .values(status=EXPIRED, processed_at=int(time()))
+        )
+
+    def cancel(self) -> bool:
+        """
+        Withdraw the request, unless the admission workers processed it meanwhile
+        """
+        cls = type(self)
+        cancelled = db.session.execute(
+            cls.__table__.update()
+            .where(and_(cls.id == self.id, cls.status.in_(OPEN)))
+            .values(status=CANCELLED, processed_at=int(time()))
+        ).rowcount
+        db.session.commit()
+        return cancelled == 1
+
+    def save_to_db(self) -> None:
+        db.session.add(self)
+        db.session.commit()
+
@@ -0,0 +1,19 @@
+from typing import List
+
+from db import db
+
+
+class JobRunModel(db.Model):
+    __tablename__ = "job_runs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(80), nullable=False, index=True)
+    holder = db.Column(db.String(120), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    duration = db.Column(db.Float, nullable=False)  # seconds
+    outcome = db.Column(db.String(10), nullable=False)  # "success" or "error"
+    result = db.Column(db.String(255), nullable=True)  # what the job returned, or the error
+
+    @classmethod
+    def find_latest(cls, job_id: str, limit: int = 20) -> List["JobRunModel"]:
+        return cls.query.filter_by(job_id=job_id).order_by(cls.id.desc()).limit(limit).all()
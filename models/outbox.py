@@ -0,0 +1,117 @@
+import json
+from random import random
+from time import time
+from typing import List
+from uuid import uuid4
+
+from sqlalchemy import and_, or_, select
+
+from db import db
+
+OUTBOX_LEASE_DELTA = 60  # seconds a claimed message is reserved for the worker that claimed it
+OUTBOX_BACKOFF_BASE = 5
+OUTBOX_BACKOFF_MAX = 3600
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+
+class OutboxModel(db.Model):
+    __tablename__ = "outbox"
+    __table_args__ = (db.Index("ix_outbox_due", "status", "next_attempt_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(10), nullable=False)  # "email", "sms" or "bulk" (an e-mail to many members)
+    recipient = db.Column(db.String(80), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # json encoded message contents
+    status = db.Column(db.String(10), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.Integer, nullable=False)
+    claimed_by = db.Column(db.String(32), nullable=True, index=True)
+    claimed_until = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.Integer, nullable=False)
+    sent_at = db.Column(db.Integer, nullable=True)
+    last_error = db.Column(db.String(200), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+
+    def __init__(self, channel: str, recipient: str, payload: dict, user_id: int = None, **kwargs):
+        super().__init__(**kwargs)
+        self.channel = channel
+        self.recipient = recipient
+        self.payload = json.dumps(payload)
+        self.user_id = user_id
+        self.status = PENDING
+        self.attempts = 0
+        self.created_at = self.next_attempt_at = int(time())
+
+    @property
+    def contents(self) -> dict:
+        return json.loads(self.payload)
+
+    @classmethod
+    def find_by_id(cls, _id: int) -> "OutboxModel":
+        return cls.query.filter_by(id=_id).first()
+
+    @classmethod
+    def find_by_user(cls, user_id: int) -> List["OutboxModel"]:
+        return cls.query.filter_by(user_id=user_id).order_by(cls.id).all()
+
+    @classmethod
+    def claim_batch(cls, limit: int) -> List["OutboxModel"]:
+        """
+        Reserve up to `limit` due messages for the calling worker with a single UPDATE and return them.
+        The lease condition is repeated outside the subquery so that concurrent claimers never get the same row.
+        """
+        now = int(time())
+        token = uuid4().hex
+        claimable = and_(
+            cls.status == PENDING,
+            cls.next_attempt_at <= now,
+            or_(cls.claimed_until.is_(None), cls.claimed_until < now),
+        )
+        due = select([cls.id]).where(claimable).order_by(cls.next_attempt_at).limit(limit)
+        db.session.execute(
+            cls.__table__.update()
+            .where(and_(cls.id.in_(due), claimable))
+            .values(claimed_by=token, claimed_until=now + OUTBOX_LEASE_DELTA)
+        )
+        db.session.commit()
+        return cls.query.filter_by(claimed_by=token).all()
+
+    def renew_claim(self, token: str) -> bool:
+        """
+        Extend the claim `token` has on the message right before a delivery, so that a long batch never outlives
+        its lease. Returns False when another worker took the message over meanwhile.
+        """
+        cls = type(self)
+        renewed = db.session.execute(
+            cls.__table__.update()
+            .where(and_(cls.id == self.id, cls.claimed_by == token, cls.status == PENDING))
+            .values(claimed_until=int(time()) + OUTBOX_LEASE_DELTA)
+        ).rowcount
+        db.session.commit()
+        return renewed == 1
+
+    def mark_sent(self) -> None:
+        self.status = SENT
+        self.attempts += 1
+        self.sent_at = int(time())
+        self.claimed_until = None
+
+    def mark_failed(self, error: str, max_attempts: int) -> None:
+        """
+        Schedule a retry with exponential backoff (and some jitter), or give up after `max_attempts`
+        """
+        self.attempts += 1
+        self.last_error = error[:200]
+        self.claimed_until = None
+        if self.attempts >= max_attempts:
+            self.status = FAILED
+        else:
+            backoff = min(OUTBOX_BACKOFF_BASE * 2 ** (self.attempts - 1), OUTBOX_BACKOFF_MAX)
+            self.next_attempt_at = int(time() + backoff * (1 + random() / 2))
+
+    def save_to_db(self) -> None:
+        db.session.add(self)
+        db.session.commit()
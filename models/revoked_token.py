@@ -0,0 +1,10 @@
+from db import db
+
+
+class RevokedTokenModel(db.Model):
+    __tablename__ = "revoked_tokens"
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    expire_at = db.Column(db.Integer, nullable=True, index=True)  # None if the token never expires
+    created_at = db.Column(db.Float, nullable=False, index=True)  # what the workers sync on, see libs.revocation
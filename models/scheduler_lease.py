@@ -0,0 +1,9 @@
+from db import db
+
+
+class SchedulerLeaseModel(db.Model):
+    __tablename__ = "scheduler_leases"
+
+    name = db.Column(db.String(80), primary_key=True)
+    holder = db.Column(db.String(120), nullable=False)  # host:pid:token of the worker running the jobs
+    expires_at = db.Column(db.DateTime, nullable=False)
@@ -1,13 +1,15 @@
-from requests import Response
+from typing import List, Union
+
 from flask import request, url_for
-from twilio.rest.api.v2010.account.message import MessageInstance
+from sqlalchemy import distinct, inspect, select
 
 from libs.strings import gettext
-from libs.twilio import Twilio
 
+from cache import cache
 from db import db
-from libs.mailgun import Mailgun
 from models.confirmation import ConfirmationModel
+from models.outbox import OutboxModel
+from outbox import outbox
 
 
 class UserModel(db.Model):
@@ -29,8 +31,12 @@ class UserModel(db.Model):
 
     @property
     def most_recent_confirmation(self) -> "ConfirmationModel":
-        # ordered by expiration time (in descending order)
-        return self.confirmation.order_by(db.desc(ConfirmationModel.expire_at)).first()
+        # memoized for the session (i.e. the request), forgotten when one of the user's confirmations is flushed
+        recent = db.session.info.setdefault("most_recent_confirmation", {})
+        if self.id not in recent:
+            # ordered by expiration time (in descending order)
+            recent[self.id] = self.confirmation.order_by(db.desc(ConfirmationModel.expire_at)).first()
+        return recent[self.id]
 
     @classmethod
     def find_by_username(cls, username: str) -> "UserModel":
@@ -48,28 +54,76 @@ class UserModel(db.Model):
     def find_by_id(cls, _id: int) -> "UserModel":
         return cls.query.filter_by(id=_id).first()
 
-    def send_confirmation_email(self) -> Response:
-        # configure e-mail contents
-        subject = "Registration Confirmation"
-        link = request.url_root[:-1] + url_for(
-            "confirmation", confirmation_id=self.most_recent_confirmation.id
-        )
+    @classmethod
+    def find_row_by_id(cls, _id: int) -> Union[tuple, None]:
+        """
+        The user's column values followed by the list UserSchema dumps as "confirmation", the id of the most
+        recent confirmation, in one query
+        """
+        recent = db.session.query(ConfirmationModel.id).filter(ConfirmationModel.user_id == cls.id).order_by(
+            db.desc(ConfirmationModel.expire_at)
+        ).limit(1).correlate(cls).as_scalar()
+        row = db.session.query(*cls.__table__.columns, recent).filter(cls.id == _id).first()
+        if row is None:
+            return None
+        return (*row[:-1], [row[-1]] if row[-1] is not None else [])
+
+    def send_confirmation_email(self) -> OutboxModel:
         # string[:-1] means copying from start (inclusive) to the last index (exclusive), a more detailed link below:
         # from `http://127.0.0.1:5000/` to `http://127.0.0.1:5000`, since the url_for() would also contain a `/`
         # https://stackoverflow.com/questions/509211/understanding-pythons-slice-notation
+        contents = self.confirmation_email(request.url_root[:-1], self.most_recent_confirmation.id)
+        # queue the e-mail, it is sent with MailGun by the outbox workers
+        return self.queue_message("email", self.email, contents)
+
+    def send_sms(self) -> OutboxModel:
+        contents = self.confirmation_sms(self.most_recent_confirmation.code)
+        return self.queue_message("sms", self.sms_number(self.phone), contents)
+
+    @staticmethod
+    def confirmation_email(url_root: str, confirmation_id: str) -> dict:
+        """
+        Contents of the confirmation e-mail, `url_root` is the scheme and host the link points to
+        """
+        subject = "Registration Confirmation"
+        link = url_root + url_for("confirmation", confirmation_id=confirmation_id)
         text = f"Please click the link to confirm your registration: {link}"
         html = f"<html>Please click the link to confirm your registration: <a href={link}>link</a></html>"
-        # send e-mail with MailGun
-        return Mailgun.send_email([self.email], subject, text, html)
+        return {"subject": subject, "text": text, "html": html}
+
+    @staticmethod
+    def confirmation_sms(code: int) -> dict:
+        return {"body": gettext("user_sms_text_code").format(str(code))}
+
+    @staticmethod
+    def sms_number(phone: str) -> str:
+        return "+351" + phone
+
+    def queue_message(self, channel: str, recipient: str, payload: dict) -> OutboxModel:
+        message = OutboxModel(channel, recipient, payload, user_id=self.id)
+        message.save_to_db()
+        outbox.notify()
+        return message
 
-    def send_sms(self) -> MessageInstance:
-        text = gettext("user_sms_text_code").format(str(self.most_recent_confirmation.code))
-        return Twilio.send_sms(number="+351" + self.phone, body=text)
+    @staticmethod
+    def roster_namespaces(*ids: int) -> List[str]:
+        """
+        Cache namespaces of the rosters (GetEnrolledUsers) listing the users, to invalidate when they change
+        """
+        association = db.metadata.tables["association"]  # models.course, which imports this module
+        courses = select([distinct(association.c.courses)]).where(association.c.users.in_(ids))
+        return [f"enrolled:{course_id}" for course_id, in db.session.execute(courses)]
 
     def save_to_db(self) -> None:
+        # the rosters only show the name, other changes (e.g. a password rehash on login) leave them cached
+        renamed = inspect(self).persistent and inspect(self).attrs.name.history.has_changes()
         db.session.add(self)
         db.session.commit()
+        if renamed:
+            cache.invalidate_namespace(*self.roster_namespaces(self.id))
 
     def delete_from_db(self) -> None:
+        rosters = self.roster_namespaces(self.id)
         db.session.delete(self)
         db.session.commit()
+        cache.invalidate_namespace(*rosters)
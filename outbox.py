@@ -0,0 +1,3 @@
+from libs.outbox import OutboxDispatcher
+
+outbox = OutboxDispatcher()
@@ -1,16 +1,19 @@
 from flask import render_template, make_response, request
 from flask_restful import Resource
+from flask_jwt_extended import jwt_required, get_jwt_identity
 import traceback
 from time import time
 
-from libs.twilio import TwilioException
 from models.confirmation import ConfirmationModel
+from models.outbox import OutboxModel
 from schemas.confirmation import ConfirmationSchema
+from schemas.outbox import OutboxSchema
 from models.user import UserModel
-from libs.mailgun import MailGunException
 from libs.strings import gettext
 
 confirmation_schema = ConfirmationSchema()
+outbox_schema = OutboxSchema()
+outbox_list_schema = OutboxSchema(many=True)
 
 
 class Confirmation(Resource):
@@ -87,10 +90,6 @@ class ConfirmationByUser(Resource):
             user.send_confirmation_email()  # re-send the confirmation email
             user.send_sms()
             return {"message": gettext("confirmation_resend_successful")}, 201
-        except MailGunException as e:
-            return {"message": str(e)}, 500
-        except TwilioException as e:
-            return {"message": str(e)}, 500
         except:
             traceback.print_exc()
             return {"message": gettext("confirmation_resend_fail")}, 500
@@ -122,3 +121,28 @@ class ConfirmationByCode(Resource):
         confirmation.confirmed = True
         confirmation.save_to_db()
         return {"message": gettext("confirmation_successful")}, 200
+
+
+class OutboxMessage(Resource):
+    @classmethod
+    @jwt_required
+    def get(cls, message_id: int):
+        """
+        Delivery status of a queued e-mail or sms, only for the member it was queued for.
+        """
+        message = OutboxModel.find_by_id(message_id)
+        if not message or message.user_id != get_jwt_identity():  # other members' messages are not disclosed
+            return {"message": gettext("outbox_message_not_found")}, 404
+        return outbox_schema.dump(message), 200
+
+
+class OutboxByUser(Resource):
+    @classmethod
+    @jwt_required
+    def get(cls, user_id: int):
+        """
+        Delivery status of every e-mail and sms queued for the user, only for the user themselves.
+        """
+        if user_id != get_jwt_identity():
+            return {"message": gettext("outbox_forbidden")}, 403
+        return {"messages": outbox_list_schema.dump(OutboxModel.find_by_user(user_id))}, 200
@@ -1,19 +1,42 @@
-from flask import request
+from flask import current_app, request
 from flask_restful import Resource
+from flask_jwt_extended import get_jwt_claims, jwt_required
 
+from admission import admission
+from cache import cache
+from db import db
+from libs.mailgun import Mailgun
 from models.course import CourseModel
+from models.enrollment_request import EnrollmentRequestModel
+from models.outbox import OutboxModel
 from models.user import UserModel
-from schemas.course import CourseSchema
+from outbox import outbox
+from schemas.announcement import AnnouncementSchema
+from schemas.course import CourseSchema, dump_course_row
+from schemas.enrollment_batch import EnrollmentBatchSchema
+from schemas.enrollment_request import EnrollmentRequestSchema
+from libs import serialization
 from libs.strings import gettext
+from utils.pagination import encode_cursor, decode_cursor, page_size
 
 course_schema = CourseSchema()
 course_list_schema = CourseSchema(many=True)
+enrollment_request_schema = EnrollmentRequestSchema()
+enrollment_batch_schema = EnrollmentBatchSchema()
+announcement_schema = AnnouncementSchema()
 week_list = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday']
 
 
 class Course(Resource):
     @classmethod
     def get(cls, name: str = None, course_id: int = None):
+        key = f"course:{course_id}" if course_id else f"course_name:{name}"
+        return cache.cached(key, lambda: cls._get(name, course_id))
+
+    @classmethod
+    def _get(cls, name: str = None, course_id: int = None):
+        if serialization.enabled:
+            return cls._get_rows(name, course_id)
         course = CourseModel.find_by_name(name)
         if course_id:
             course = CourseModel.find_by_id(course_id)
@@ -24,6 +47,15 @@ class Course(Resource):
 
         return {"message": gettext("course_not_found")}, 404
 
+    @classmethod
+    def _get_rows(cls, name: str = None, course_id: int = None):
+        rows = CourseModel.find_rows(course_id, name)
+        if rows and course_id:
+            return dump_course_row(rows[0]), 200
+        if rows:
+            return {"course_intances": [dump_course_row(row) for row in rows]}, 200
+        return {"message": gettext("course_not_found")}, 404
+
     @classmethod
     def post(cls, name: str):
         data = request.get_json()
@@ -32,7 +64,7 @@ class Course(Resource):
         #     if course.start_time == converted_start_time:
         #         return {"message": gettext("course_already_scheduled").format(name)}, 400
         data["name"] = name
-        course = course_schema.load(data)
+        course = CourseSchema().load(data)  # ModelSchema.load keeps state on the schema, one per request
         try:
             course.save_to_db()
         except:
@@ -53,7 +85,31 @@ class Course(Resource):
 class CourseList(Resource):
     @classmethod
     def get(cls):
-        return {"courses": course_list_schema.dump(CourseModel.query.order_by(CourseModel.day_week).all())}, 200
+        return cache.cached(request.query_string.decode(), cls._get, namespace="courses")
+
+    @classmethod
+    def _get(cls):
+        args = request.args
+        limit = page_size(args.get("limit", type=int))
+        try:
+            after = decode_cursor(args["cursor"]) if "cursor" in args else None
+            rows = CourseModel.find_page(
+                limit + 1,
+                after,
+                day_week=args.get("day_week", type=int),
+                location=args.get("location"),
+                month=args.get("month", type=int),
+                year=args.get("year", type=int),
+                name_prefix=args.get("name"),
+            )
+        except (ValueError, TypeError):  # malformed cursor
+            return {"message": gettext("pagination_invalid_cursor")}, 400
+        next_cursor = encode_cursor(CourseModel.page_key(rows[limit - 1])) if len(rows) > limit else None
+        if serialization.enabled:
+            courses = [dump_course_row(row) for row in rows[:limit]]
+        else:
+            courses = course_list_schema.dump(rows[:limit])
+        return {"courses": courses, "next_cursor": next_cursor}, 200
 
 
 class EnrollUser(Resource):
@@ -64,19 +120,24 @@ class EnrollUser(Resource):
         user = UserModel.find_by_id(data['user_id'])
         if user:
             if course:
-                if user in course.users:
-                    return {"message": gettext('user_already_enrolled').format
-                            (course.name, week_list[course.day_week].capitalize() +
-                             course.start_time.strftime(' - %H:%M'))}, 400
-                else:
-                    course.enroll_user(user)
+                if admission.enabled and not course.is_enrolled(user):  # handled in order by the admission workers
+                    ticket = admission.submit(course.id, user.id)
+                    return {"message": gettext('enrollment_queued').format
+                            (course.name, _schedule(course)),
+                            "ticket": ticket.ticket, "status": ticket.status}, 202
+                if not course.enroll_user(user):
+                    # the insert is skipped both when the user is already enrolled and when the course is full
+                    if course.is_enrolled(user):
+                        return {"message": gettext('user_already_enrolled').format
+                                (course.name, _schedule(course))}, 400
+                    return {"message": gettext('course_full').format
+                            (course.name, _schedule(course))}, 409
             else:
                 return {"message": gettext("course_not_found")}, 404
         else:
             return {"message": gettext("user_not_found")}, 404
         return {"message": gettext("user_enrolled").format
-                (course.name, week_list[course.day_week].capitalize() +
-                 course.start_time.strftime(' - %H:%M'))}, 200
+                (course.name, _schedule(course))}, 200
 
 
 class DisenrollUser(Resource):
@@ -87,24 +148,160 @@ class DisenrollUser(Resource):
         user = UserModel.find_by_id(data['user_id'])
         if user:
             if course:
-                if user not in course.users:
+                if not course.disenroll_user(user):
                     return {"message": gettext('user_not_enrolled')}, 400
-                else:
-                    course.disenroll_user(user)
+                if admission.enabled:  # a slot was freed, promote the waitlist
+                    admission.notify()
             else:
                 return {"message": gettext("course_not_found")}, 404
         else:
             return {"message": gettext("user_not_found")}, 404
         return {"message": gettext("user_disenrolled").format
-                (course.name, week_list[course.day_week].capitalize() +
-                 course.start_time.strftime(' - %H:%M'))}, 200
+                (course.name, _schedule(course))}, 200
+
+
+class EnrollmentBatch(Resource):
+    # outcome of CourseModel.apply_batch -> status and message key of the equivalent single request
+    OUTCOMES = {
+        "enrolled": (200, "user_enrolled"),
+        "disenrolled": (200, "user_disenrolled"),
+        "user_not_found": (404, "user_not_found"),
+        "course_not_found": (404, "course_not_found"),
+        "already_enrolled": (400, "user_already_enrolled"),
+        "course_full": (409, "course_full"),
+        "not_enrolled": (400, "user_not_enrolled"),
+    }
+
+    @classmethod
+    def post(cls):
+        """
+        Enroll and disenroll many members in one transaction, e.g. to move a class roster. Answers 200 with
+        the status and message each operation would have had as a single EnrollUser/DisenrollUser request.
+        """
+        operations = enrollment_batch_schema.load(request.get_json())["operations"]
+        outcomes, courses = CourseModel.apply_batch(operations)
+        if admission.enabled and "disenrolled" in outcomes:  # slots were freed, promote the waitlists
+            admission.notify()
+        results = []
+        for operation, outcome in zip(operations, outcomes):
+            status, key = cls.OUTCOMES[outcome]
+            course = courses.get(operation["course_id"])
+            message = gettext(key)
+            if course is not None:
+                message = message.format(course.name, _schedule(course))
+            results.append(dict(operation, status=status, message=message))
+        return {"results": results}, 200
+
+
+class EnrollmentTicket(Resource):
+    @classmethod
+    def get(cls, ticket: str):
+        """
+        Outcome of an enrollment queued in admission mode, with the place in the queue or waitlist while open
+        """
+        request_ = EnrollmentRequestModel.find_by_ticket(ticket)
+        if not request_:
+            return {"message": gettext("enrollment_ticket_not_found")}, 404
+        return enrollment_request_schema.dump(request_), 200
+
+    @classmethod
+    def delete(cls, ticket: str):
+        request_ = EnrollmentRequestModel.find_by_ticket(ticket)
+        if not request_:
+            return {"message": gettext("enrollment_ticket_not_found")}, 404
+        if not request_.cancel():
+            return {"message": gettext("enrollment_ticket_closed")}, 409
+        return {"message": gettext("enrollment_ticket_cancelled")}, 200
 
 
 class GetEnrolledUsers(Resource):
     @classmethod
     def get(cls, course_id: int):
+        return cache.cached(request.query_string.decode(), lambda: cls._get(course_id),
+                            namespace=f"enrolled:{course_id}")
+
+    @classmethod
+    def _get(cls, course_id: int):
+        args = request.args
+        limit = page_size(args.get("limit", type=int))
+        try:
+            after = decode_cursor(args["cursor"])[0] if "cursor" in args else None
+        except (ValueError, IndexError):
+            return {"message": gettext("pagination_invalid_cursor")}, 400
         course = CourseModel.find_by_id(course_id)
         if course:
-            return {"registered users": [{"id": user.id, "name": user.name} for user in course.users]}
+            rows = course.find_enrolled_page(limit + 1, after, name_prefix=args.get("name"))
+            next_cursor = encode_cursor([rows[limit - 1].id]) if len(rows) > limit else None
+            return {"registered users": [{"id": _id, "name": name} for _id, name in rows[:limit]],
+                    "next_cursor": next_cursor}, 200
         else:
             return {"message": gettext("course_not_found")}, 404
+
+
+class CourseAnnouncement(Resource):
+    @classmethod
+    @jwt_required
+    def post(cls, course_id: int):
+        """
+        Send one e-mail to every member enrolled in the course (e.g. a cancellation). The contents may use
+        `%recipient.name%` and `%recipient.id%`. Queued in the outbox, one message per Mailgun batch. Staff only.
+        """
+        if not get_jwt_claims().get("is_admin"):
+            return {"message": gettext("user_admin_required")}, 403
+        announcement = announcement_schema.load(request.get_json())
+        course = CourseModel.find_by_id(course_id)
+        if not course:
+            return {"message": gettext("course_not_found")}, 404
+        recipients = course.find_recipients()
+        for start in range(0, len(recipients), Mailgun.BATCH_SIZE):
+            batch = {email: {"id": _id, "name": name}
+                     for _id, name, email in recipients[start:start + Mailgun.BATCH_SIZE]}
+            db.session.add(OutboxModel("bulk", f"course:{course_id}", dict(announcement, recipients=batch)))
+        db.session.commit()
+        outbox.notify()
+        return {"message": gettext("course_announcement_queued").format(len(recipients), course.name),
+                "recipients": len(recipients)}, 202
+
+
+class Timetable(Resource):
+    @classmethod
+    def get(cls):
+        if current_app.config.get("TIMETABLE_CACHE", True):
+            return cache.cached("timetable", cls._get, namespace="timetable")
+        return cls._get()
+
+    @classmethod
+    def _get(cls):
+        days = []
+        for row in CourseModel.find_timetable():
+            if not days or days[-1]["day_week"] != row.day_week:
+                days.append({"day_week": row.day_week, "day": _day_name(row.day_week), "courses": []})
+            days[-1]["courses"].append({
+                "id": row.id,
+                "name": row.name,
+                "location": row.location,
+                "start_time": row.start_time.isoformat() if row.start_time else None,
+                "slots": row.slots,
+                "enrolled": row.enrolled,
+                "remaining": None if row.slots is None else max(row.slots - row.enrolled, 0),
+            })
+        return {"timetable": days}, 200
+
+
+def _day_name(day_week):
+    return week_list[day_week] if day_week is not None and 0 <= day_week < len(week_list) else None
+
+
+def _schedule(course) -> str:
+    """
+    "Monday - 09:00" for the messages, leaving out the day or the time when the course has none
+    """
+    day = _day_name(course.day_week)
+    parts = [day.capitalize() if day else None, course.start_time.strftime('%H:%M') if course.start_time else None]
+    return ' - '.join(part for part in parts if part)
+
+
+class CacheStats(Resource):
+    @classmethod
+    def get(cls):
+        return cache.stats(), 200
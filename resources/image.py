@@ -1,3 +1,5 @@
+import os
+
 from flask_restful import Resource
 from flask_uploads import UploadNotAllowed
 from flask import request
@@ -24,3 +26,27 @@ class ImageUpload(Resource):
         except UploadNotAllowed:
             extension = image_helper.get_extension(data["image"])
             return {"message": gettext("image_illegal_extension").format(extension)}, 400
+
+
+class Image(Resource):
+    @jwt_required
+    def get(self, filename: str):
+        """
+        Return one of the user's images, by file name or format-less name. `?size=` selects a thumbnail.
+        """
+        user_id = get_jwt_identity()
+        folder = f"user_{user_id}"
+        found = image_helper.image_index.lookup(folder, filename)
+        if found is None:
+            return {"message": gettext("image_not_found").format(filename)}, 404
+        basename, digest = found
+        size = request.args.get("size", type=int)
+        if size is None:
+            return image_helper.send_image(image_helper.get_path(basename, folder=folder), digest)
+        if size not in image_helper.thumbnail_sizes:
+            return {"message": gettext("image_illegal_size").format(size)}, 400
+        extension = image_helper.get_extension(basename).lstrip(".")
+        path = image_helper.blob_path(digest, extension, size)
+        if not os.path.isfile(path):  # still being generated, or not a format with thumbnails
+            return {"message": gettext("image_not_found").format(f"{filename}?size={size}")}, 404
+        return image_helper.send_image(path, f"{digest}_{size}")
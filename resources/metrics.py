@@ -0,0 +1,13 @@
+from flask import current_app
+from flask_restful import Resource
+
+from metrics import metrics
+
+
+class Metrics(Resource):
+    @classmethod
+    def get(cls):
+        """
+        Prometheus text exposition of the metrics of every worker
+        """
+        return current_app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
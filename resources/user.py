@@ -7,19 +7,28 @@ from flask_jwt_extended import (
     get_jwt_identity,
     jwt_required,
     get_raw_jwt,
+    get_jwt_claims,
 )
+import io
 import traceback
 
-from libs.twilio import TwilioException
 from models.user import UserModel
-from schemas.user import UserSchema
+from schemas.user import UserSchema, dump_user_row
 from models.confirmation import ConfirmationModel
 from blacklist import BLACKLIST
-from libs.mailgun import MailGunException
+from libs import serialization
+from libs.member_import import import_members
 from libs.strings import gettext
-from utils.password_manager import encrypt_password, check_encrypted_password
+from utils.password_manager import encrypt_password, verify_and_update
 
-user_schema = UserSchema()
+user_schema = UserSchema()  # dumps only: ModelSchema.load keeps the instance it fills on the schema, see _load_user
+
+
+def _load_user(user_json: dict, **kwargs) -> UserModel:
+    """
+    Load the request's user with a schema of its own, a shared one is not thread-safe
+    """
+    return UserSchema().load(user_json, instance=UserModel(), **kwargs)
 
 
 class UserRegister(Resource):
@@ -28,7 +37,7 @@ class UserRegister(Resource):
         user_json = request.get_json()
         if 'password' in user_json:
             user_json['password'] = encrypt_password(user_json['password'])
-        user = user_schema.load(user_json, instance=UserModel())
+        user = _load_user(user_json)
 
         # if UserModel.find_by_username(user.username):
         #     return {"message": gettext("user_username_exists")}, 400
@@ -49,12 +58,6 @@ class UserRegister(Resource):
             if user.phone:
                 user.send_sms()
             return {"message": gettext("user_registered")}, 201
-        except MailGunException as e:
-            user.delete_from_db()  # rollback
-            return {"message": str(e)}, 500
-        except TwilioException as e:
-            user.delete_from_db()  # rollback
-            return {"message": str(e)}, 500
         except:  # failed to save user to db
             traceback.print_exc()
             user.delete_from_db()  # rollback
@@ -85,12 +88,6 @@ class UserRegister(Resource):
             elif not user.most_recent_confirmation.expired:
                 return {"message": gettext("confirmation_already_sent")}, 409
             return {"message": gettext("user_registered")}, 201
-        except MailGunException as e:
-            user.delete_from_db()  # rollback
-            return {"message": str(e)}, 500
-        except TwilioException as e:
-            user.delete_from_db()  # rollback
-            return {"message": str(e)}, 500
         except:  # failed to save user to db
             traceback.print_exc()
             return {"message": gettext("user_error_creating")}, 500
@@ -100,6 +97,11 @@ class User(Resource):
     @classmethod
     @jwt_required
     def get(cls, user_id: int):
+        if serialization.enabled:
+            row = UserModel.find_row_by_id(user_id)
+            if row is None:
+                return {"message": gettext("user_not_found")}, 404
+            return serialization.json_response(dump_user_row(row))
         user = UserModel.find_by_id(user_id)
         if not user:
             return {"message": gettext("user_not_found")}, 404
@@ -116,17 +118,41 @@ class User(Resource):
         return {"message": gettext("user_deleted")}, 200
 
 
+class UserImport(Resource):
+    @classmethod
+    @jwt_required
+    def post(cls):
+        """
+        Create or update the members in the CSV or NDJSON request body (`?format=csv|ndjson`, defaults to the
+        content type), `?notify=1` queues the confirmations of the new members. Staff only.
+        """
+        if not get_jwt_claims().get("is_admin"):
+            return {"message": gettext("user_admin_required")}, 403
+        fmt = request.args.get("format") or ("ndjson" if "json" in (request.mimetype or "") else "csv")
+        notify = request.args.get("notify", "0").lower() in ("1", "true", "yes")
+        stream = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+        try:
+            report = import_members(stream, fmt, notify, request.url_root[:-1])
+        except ValueError:
+            return {"message": gettext("user_import_invalid_format").format(fmt)}, 400
+        return report, 200
+
+
 class UserLogin(Resource):
     @classmethod
     def post(cls):
         user_json = request.get_json()
-        user_data = user_schema.load(user_json, instance=UserModel(), partial=('email', 'phone', 'name',))
+        user_data = _load_user(user_json, partial=('email', 'phone', 'name',))
 
         user = UserModel.find_by_id(user_data.id)
         if not user.password:
             return {"message": gettext("user_not_registered").format(user.email)}, 400
 
-        if user and check_encrypted_password(user_data.password, user.password):
+        valid, new_hash = verify_and_update(user_data.password, user.password)
+        if valid:
+            if new_hash:  # stored hash was made with fewer rounds than PASSWORD_HASH_ROUNDS
+                user.password = new_hash
+                user.save_to_db()
             confirmation = user.most_recent_confirmation
             if confirmation and confirmation.confirmed:
                 access_token = create_access_token(user.id, fresh=True)
@@ -144,9 +170,10 @@ class UserLogout(Resource):
     @classmethod
     @jwt_required
     def post(cls):
-        jti = get_raw_jwt()["jti"]  # jti is "JWT ID", a unique identifier for a JWT.
+        token = get_raw_jwt()
+        jti = token["jti"]  # jti is "JWT ID", a unique identifier for a JWT.
         user_id = get_jwt_identity()
-        BLACKLIST.add(jti)
+        BLACKLIST.add(jti, token.get("exp"))  # no "exp" when the token never expires
         return {"message": gettext("user_logged_out").format(user_id)}, 200
 
 
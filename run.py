@@ -1,8 +1,35 @@
+"""
+The WSGI app, served by uwsgi with uwsgi.ini (see Procfile).
+
+It can also be served by uvicorn, for many concurrent or slow clients, through uvicorn's WSGI bridge (the
+resources stay synchronous and run in its thread pool):
+
+    uvicorn run:app --interface wsgi --host 0.0.0.0 --port $PORT
+
+Run a single uvicorn process: without uwsgi the response cache and the metrics live in the memory of the
+process, more workers would serve stale /timetable and /enrolled_users responses. uvicorn reads each request
+body into memory before the app sees it, so keep it behind a proxy that rejects bodies over MAX_CONTENT_LENGTH
+(e.g. nginx with `client_max_body_size 10m`).
+"""
+import gc
+
 from app import app
 from db import db
+from libs import migrations
 
 db.init_app(app)
+db.app = app  # the scheduled jobs open their own application context
+
+# once, in the uwsgi master: db.create_all() adds the missing tables, not the columns and keys of existing ones
+with app.app_context():
+    for change in migrations.upgrade():
+        print(f"Database upgraded: {change}")
+    db.engine.dispose()  # the forked workers open their own connections
 
 @app.before_first_request
 def create_tables():
-    db.create_all()
\ No newline at end of file
+    db.create_all()
+
+# uwsgi imports this module in the master and forks the workers from it: keep what is loaded by now (modules,
+# string catalog) out of the cyclic collector, whose passes would otherwise copy those pages into every worker
+gc.freeze()
@@ -0,0 +1,3 @@
+from libs.scheduler import JobScheduler
+
+scheduler = JobScheduler()
@@ -0,0 +1,7 @@
+from marshmallow import Schema, fields, validate
+
+
+class AnnouncementSchema(Schema):
+    subject = fields.String(required=True, validate=validate.Length(min=1, max=200))
+    text = fields.String(required=True, validate=validate.Length(min=1))
+    html = fields.String()
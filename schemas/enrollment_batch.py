@@ -0,0 +1,15 @@
+from marshmallow import Schema, fields, validate
+
+MAX_OPERATIONS = 1000
+
+
+class EnrollmentOperationSchema(Schema):
+    action = fields.String(required=True, validate=validate.OneOf(("enroll", "disenroll")))
+    user_id = fields.Integer(required=True)
+    course_id = fields.Integer(required=True)
+
+
+class EnrollmentBatchSchema(Schema):
+    operations = fields.Nested(
+        EnrollmentOperationSchema, many=True, required=True, validate=validate.Length(min=1, max=MAX_OPERATIONS)
+    )
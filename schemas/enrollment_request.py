@@ -0,0 +1,11 @@
+from ma import ma
+from models.enrollment_request import EnrollmentRequestModel
+
+
+class EnrollmentRequestSchema(ma.ModelSchema):
+    position = ma.Integer(dump_only=True)
+
+    class Meta:
+        model = EnrollmentRequestModel
+        exclude = ("id",)
+        include_fk = True
@@ -0,0 +1,11 @@
+from ma import ma
+from models.outbox import OutboxModel
+
+
+class OutboxSchema(ma.ModelSchema):
+    class Meta:
+        model = OutboxModel
+        # the address and the provider errors (which may quote it) are not shown to the member
+        exclude = ("payload", "recipient", "last_error", "claimed_by", "claimed_until")
+        dump_only = ("id", "status", "attempts", "next_attempt_at", "created_at", "sent_at")
+        include_fk = True
@@ -0,0 +1,99 @@
+"""
+Test fixtures: `run:app` configured for an isolated SQLite database, with the outbox delivering to the
+FakeProvider and the scheduler off. Every test starts from empty tables and an empty response cache. No outbox
+worker is started, the tests that deliver messages call `outbox.dispatch_once()` themselves.
+Run from the repository root with `python -m pytest`.
+"""
+import os
+import sys
+import tempfile
+from datetime import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # strings/ and static/ are looked up relative to the repository root
+os.environ.update({
+    "APPLICATION_SETTINGS": os.path.join(ROOT, "config.py"),
+    "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='playrestapi-tests-'), 'test.db')}",
+    "JWT_SECRET_KEY": os.environ.get("JWT_SECRET_KEY", "test"),
+    "OUTBOX_PROVIDER": "fake",
+    "REVOCATION_BACKEND": "memory",
+    "RESPONSE_CACHE_BACKEND": "lru",
+    "SCHEDULER_MODE": "off",
+    "ADMIN_USER_IDS": "900",
+})
+ADMIN_ID = 900  # a staff member (is_admin claim), see admin_headers
+
+
+@pytest.fixture
+def app():
+    from run import app
+    from cache import cache
+    from db import db
+    from outbox import outbox
+
+    outbox.workers = 0
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+    cache.clear()
+    yield app
+    with app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_course(app):
+    from db import db
+    from models.course import CourseModel
+
+    def make(name: str = "Yoga", slots: int = None, day_week: int = 0, start_time=time(9), **columns):
+        with app.app_context():
+            course = CourseModel(name=name, location="Main room", day_week=day_week, start_time=start_time,
+                                 slots=slots, **columns)
+            db.session.add(course)
+            db.session.commit()
+            return course.id
+
+    return make
+
+
+@pytest.fixture
+def make_users(app):
+    from db import db
+    from models.user import UserModel
+
+    def make(count: int, start: int = 1) -> list:
+        ids = list(range(start, start + count))
+        with app.app_context():
+            db.session.execute(UserModel.__table__.insert(), [
+                {"id": _id, "email": f"member{_id}@example.com", "name": f"Member {_id}"} for _id in ids
+            ])
+            db.session.commit()
+        return ids
+
+    return make
+
+
+@pytest.fixture
+def auth_headers(app):
+    from flask_jwt_extended import create_access_token
+
+    def headers(user_id: int) -> dict:
+        with app.app_context():
+            return {"Authorization": f"Bearer {create_access_token(identity=user_id, fresh=True)}"}
+
+    return headers
+
+
+@pytest.fixture
+def admin_headers(auth_headers):
+    return auth_headers(ADMIN_ID)
@@ -0,0 +1,67 @@
+"""
+Admission mode (libs.admission) with the workers driven by the test through `admission.process_once()`.
+"""
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from db import db
+from admission import admission
+from models.enrollment_request import EnrollmentRequestModel
+
+
+@pytest.fixture
+def admission_mode(monkeypatch):
+    monkeypatch.setattr(admission, "enabled", True)
+    return admission
+
+
+def enroll(client, course_id: int, user_id: int):
+    return client.post("/enroll/", json={"course_id": course_id, "user_id": user_id})
+
+
+def test_one_open_request_per_member_and_course(app, client, make_course, make_users, admission_mode, monkeypatch):
+    course_id = make_course(slots=1)
+    user_id, = make_users(1)
+
+    first = enroll(client, course_id, user_id).get_json()["ticket"]
+    assert enroll(client, course_id, user_id).get_json()["ticket"] == first
+
+    with app.app_context():  # the index keeps a second open request out
+        with pytest.raises(IntegrityError):
+            EnrollmentRequestModel(course_id, user_id).save_to_db()
+        db.session.rollback()
+
+    # a concurrent EnrollUser that missed the open request gets its ticket back instead of an error
+    calls = []
+    find_open = EnrollmentRequestModel.find_open.__func__
+
+    def miss_the_first_time(cls, course_id, user_id):
+        calls.append(course_id)
+        return None if len(calls) == 1 else find_open(cls, course_id, user_id)
+
+    monkeypatch.setattr(EnrollmentRequestModel, "find_open", classmethod(miss_the_first_time))
+    response = enroll(client, course_id, user_id)
+    assert response.status_code == 202
+    assert response.get_json()["ticket"] == first
+    with app.app_context():
+        assert EnrollmentRequestModel.query.count() == 1
+
+
+def test_disenroll_promotes_the_waitlist(app, client, make_course, make_users, admission_mode):
+    course_id = make_course(slots=1)
+    first, second, third = make_users(3)
+    tickets = [enroll(client, course_id, user_id).get_json()["ticket"] for user_id in (first, second, third)]
+    with app.app_context():
+        admission.process_once()
+    statuses = [client.get(f"/enroll/ticket/{ticket}").get_json() for ticket in tickets]
+    assert [status["status"] for status in statuses] == ["enrolled", "waitlisted", "waitlisted"]
+    assert [status["position"] for status in statuses] == [None, 1, 2]
+
+    assert client.post("/disenroll/", json={"course_id": course_id, "user_id": first}).status_code == 200
+    with app.app_context():
+        admission.process_once()
+    statuses = [client.get(f"/enroll/ticket/{ticket}").get_json() for ticket in tickets]
+    assert [status["status"] for status in statuses] == ["enrolled", "enrolled", "waitlisted"]
+    assert statuses[2]["position"] == 1
+    registered = client.get(f"/enrolled_users/{course_id}").get_json()["registered users"]
+    assert [user["id"] for user in registered] == [second]
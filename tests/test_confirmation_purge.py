@@ -0,0 +1,81 @@
+"""
+ConfirmationModel.purge keeps the latest confirmation of every user, so that their profile can still be dumped, and
+the memoized UserModel.most_recent_confirmation follows the confirmations written in the session.
+"""
+from time import time
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from db import db
+from libs import serialization
+from models.confirmation import ConfirmationModel
+from models.user import UserModel
+
+
+def add_confirmation(user_id: int, expire_at: int, confirmed: bool = False) -> str:
+    confirmation = ConfirmationModel(user_id)
+    confirmation.expire_at = expire_at
+    confirmation.confirmed = confirmed
+    db.session.add(confirmation)
+    db.session.commit()
+    return confirmation.id
+
+
+def test_purge_keeps_latest_confirmation(app, make_users):
+    only, resent, confirmed = make_users(3)
+    now = int(time())
+    with app.app_context():
+        kept_only = add_confirmation(only, now - 7 * 86400)
+        add_confirmation(resent, now - 7 * 86400)
+        kept_resent = add_confirmation(resent, now - 86400)
+        add_confirmation(confirmed, now - 86400, confirmed=True)
+        kept_confirmed = add_confirmation(confirmed, now - 3600, confirmed=True)
+        kept_latest = add_confirmation(confirmed, now - 60)  # unconfirmed but the latest
+
+        assert ConfirmationModel.purge() == 2
+        db.session.remove()
+        remaining = {c.id for c in ConfirmationModel.query}
+    assert remaining == {kept_only, kept_resent, kept_confirmed, kept_latest}
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_get_user_after_purge(app, client, make_users, monkeypatch, fast):
+    monkeypatch.setattr(serialization, "enabled", fast)
+    with_confirmation, without = make_users(2)
+    with app.app_context():
+        kept = add_confirmation(with_confirmation, int(time()) - 7 * 86400)
+        ConfirmationModel.purge()
+        db.session.remove()
+        token = create_access_token(identity=with_confirmation, fresh=True)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get(f"/user/{with_confirmation}", headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["confirmation"] == [kept]
+
+    response = client.get(f"/user/{without}", headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["confirmation"] == []
+
+
+def test_most_recent_confirmation_is_forgotten_on_flush(app, make_users):
+    resent, other = make_users(2)
+    now = int(time())
+    with app.app_context():
+        expired = add_confirmation(resent, now - 60)
+        kept = add_confirmation(other, now + 3600)
+        user, other_user = UserModel.find_by_id(resent), UserModel.find_by_id(other)
+        assert user.most_recent_confirmation.id == expired
+        assert other_user.most_recent_confirmation.id == kept
+
+        confirmation = ConfirmationModel(resent)  # as UserRegister does when the last one expired
+        db.session.add(confirmation)
+        db.session.flush()
+        assert set(db.session.info["most_recent_confirmation"]) == {other}  # only the resent user's is dropped
+        assert user.most_recent_confirmation.id == confirmation.id
+
+        db.session.delete(confirmation)
+        db.session.flush()
+        assert user.most_recent_confirmation.id == expired
+        db.session.rollback()
@@ -0,0 +1,98 @@
+from datetime import time
+
+
+def walk(client, limit: int, query: str = "") -> list:
+    ids, cursor = [], None
+    while True:
+        url = f"/courses?limit={limit}{query}" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        assert response.status_code == 200
+        body = response.get_json()
+        ids += [course["id"] for course in body["courses"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_pages_cover_courses_without_start_time(client, make_course):
+    expected = [
+        make_course(name="Yoga", day_week=0, start_time=None),
+        make_course(name="Pilates", day_week=0, start_time=time(8)),
+        make_course(name="Spinning", day_week=0, start_time=None),
+        make_course(name="Boxing", day_week=1, start_time=time(7)),
+        make_course(name="Zumba", day_week=None, start_time=None),
+    ]
+
+    for limit in (1, 2, 3, 100):
+        ids = walk(client, limit)
+        assert sorted(ids) == sorted(expected)
+        assert len(ids) == len(set(ids))
+
+
+def test_pages_follow_the_timetable_order(client, make_course):
+    late = make_course(day_week=2, start_time=time(19))
+    early = make_course(day_week=2, start_time=time(7))
+    monday = make_course(day_week=0, start_time=time(12))
+
+    assert walk(client, 1) == [monday, early, late]
+    assert walk(client, 1, "&day_week=2") == [early, late]
+
+
+
+def test_pages_walk_the_timetable_index(app, make_course):
+    from sqlalchemy import event
+
+    from db import db
+    from models.course import CourseModel
+
+    make_course(day_week=0, start_time=time(9))
+    with app.app_context():
+        for after in ([0, "09:00:00", 1], [None, None, 1], [0, None, 1]):
+            statements = []
+
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                statements.append((statement, parameters))
+
+            event.listen(db.engine, "before_cursor_execute", capture)
+            try:
+                CourseModel.find_page(10, after)
+            finally:
+                event.remove(db.engine, "before_cursor_execute", capture)
+            statement, parameters = statements[-1]
+            connection = db.engine.raw_connection()
+            try:
+                plan = " ".join(row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + statement, parameters))
+            finally:
+                connection.close()
+            assert "ix_courses_timetable" in plan
+            assert "TEMP B-TREE" not in plan
+
+
+def test_keyset_with_nulls_sorted_last(app, make_course):
+    """
+    The predicate for databases that sort NULLs last (Postgres), walked on SQLite with NULLS LAST
+    """
+    from db import db
+    from models.course import CourseModel, _after
+
+    expected = [
+        make_course(day_week=0, start_time=time(8)),
+        make_course(day_week=0, start_time=None),
+        make_course(day_week=0, start_time=None),
+        make_course(day_week=1, start_time=time(7)),
+        make_course(day_week=None, start_time=time(6)),
+        make_course(day_week=None, start_time=None),
+    ]
+    columns = (CourseModel.day_week, CourseModel.start_time, CourseModel.id)
+    with app.app_context():
+        ids, key = [], None
+        while True:
+            query = db.session.query(*CourseModel.__table__.columns)
+            if key:
+                query = query.filter(_after(columns, key, nulls_first=False))
+            rows = query.order_by(*(column.nullslast() for column in columns)).limit(2).all()
+            if not rows:
+                break
+            ids += [row.id for row in rows]
+            key = (rows[-1].day_week, rows[-1].start_time, rows[-1].id)
+    assert ids == expected
@@ -0,0 +1,19 @@
+"""
+Engine options of libs.db_profile for the database URLs the app is deployed with.
+"""
+import pytest
+
+from libs.db_profile import engine_options
+
+
+@pytest.mark.parametrize("url", ["postgres://user@host/play", "postgresql://user@host/play",
+                                 "postgresql+psycopg2://user@host/play"])
+def test_statement_timeout_on_postgres(url):
+    options = engine_options({"SQLALCHEMY_DATABASE_URI": url, "DB_STATEMENT_TIMEOUT_MS": 5000})
+    assert options["connect_args"] == {"options": "-c statement_timeout=5000"}
+    assert options["pool_size"] == 5
+
+
+def test_sqlite_has_no_pool_sizing():
+    options = engine_options({"SQLALCHEMY_DATABASE_URI": "sqlite:///data.db", "DB_STATEMENT_TIMEOUT_MS": 5000})
+    assert options == {"pool_pre_ping": True}
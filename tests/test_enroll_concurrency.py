@@ -0,0 +1,52 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time
+
+from sqlalchemy import func, select
+
+
+def test_parallel_enrolls_never_overbook(app, make_course, make_users):
+    from db import db
+    from models.course import CourseModel, association_table
+
+    slots = 10
+    course_id = make_course(slots=slots)
+    users = make_users(300)
+
+    def enroll(user_id: int) -> int:
+        return app.test_client().post("/enroll/", json={"course_id": course_id, "user_id": user_id}).status_code
+
+    with ThreadPoolExecutor(max_workers=50) as executor:
+        statuses = Counter(executor.map(enroll, users))
+
+    assert statuses == {200: slots, 409: len(users) - slots}
+    with app.app_context():
+        rows = db.session.execute(
+            select([func.count()]).select_from(association_table).where(association_table.c.courses == course_id)
+        ).scalar()
+        assert rows == slots
+        assert CourseModel.find_by_id(course_id).enrolled == slots
+
+
+def test_enrolling_twice_is_rejected(client, make_course, make_users):
+    course_id = make_course(slots=5)
+    user_id, = make_users(1)
+
+    assert client.post("/enroll/", json={"course_id": course_id, "user_id": user_id}).status_code == 200
+    assert client.post("/enroll/", json={"course_id": course_id, "user_id": user_id}).status_code == 400
+
+
+def test_batch_messages_for_a_course_without_schedule(client, make_course, make_users):
+    course_id = make_course(day_week=None, start_time=None)
+    scheduled_id = make_course(day_week=2, start_time=time(18, 30))
+    user_id, = make_users(1)
+
+    response = client.post("/enrollments/batch", json={"operations": [
+        {"action": "enroll", "user_id": user_id, "course_id": course_id},
+        {"action": "enroll", "user_id": user_id, "course_id": scheduled_id},
+        {"action": "disenroll", "user_id": user_id, "course_id": course_id},
+    ]})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [result["status"] for result in results] == [200, 200, 200]
+    assert "Wednesday - 18:30" in results[1]["message"]
@@ -0,0 +1,106 @@
+"""
+POST /users/import and libs.member_import: staff only, upserts by member number, partial records only update
+their own columns, and conflicting records are rejected without failing the rest of the import.
+"""
+from datetime import date
+
+from db import db
+from libs.member_import import MemberImport
+from models.user import UserModel
+
+
+def post(client, body: str, headers: dict, fmt: str = "csv"):
+    return client.post(f"/users/import?format={fmt}", data=body.encode(), headers=headers)
+
+
+def users(app) -> dict:
+    with app.app_context():
+        return {user.id: (user.email, user.phone, user.name, user.birth_date, user.gender)
+                for user in UserModel.query.order_by(UserModel.id)}
+
+
+def test_import_is_staff_only(client, make_users, auth_headers):
+    member, = make_users(1)
+    body = "id,email,name\n1,attacker@example.com,Mallory\n"
+    assert post(client, body, {}).status_code == 401
+    assert post(client, body, auth_headers(member)).status_code == 403
+
+
+def test_import_creates_and_updates(app, client, make_users, admin_headers):
+    make_users(1)
+    body = ("id,email,phone,name,birth_date,gender\n"
+            "1,one@example.com,911111111,One,1990-01-02,F\n"
+            "2,two@example.com,,Two,,M\n")
+    response = post(client, body, admin_headers)
+    assert response.status_code == 200
+    assert response.get_json()["created"] == 1 and response.get_json()["updated"] == 1
+    assert users(app) == {
+        1: ("one@example.com", "911111111", "One", date(1990, 1, 2), "F"),
+        2: ("two@example.com", None, "Two", None, "M"),
+    }
+    with app.app_context():
+        assert UserModel.find_by_id(2).most_recent_confirmation is not None
+
+
+def test_partial_records_keep_the_other_columns(app, client, make_users, admin_headers):
+    post(client, "id,email,phone,name,gender\n1,one@example.com,911111111,One,F\n2,two@example.com,922222222,Two,M\n",
+         admin_headers)
+
+    assert post(client, "id,email,name\n1,one@example.com,Uno\n", admin_headers).get_json()["updated"] == 1
+    body = '{"id": 2, "email": "dos@example.com"}\n'
+    assert post(client, body, admin_headers, fmt="ndjson").get_json()["updated"] == 1
+    assert users(app) == {
+        1: ("one@example.com", "911111111", "Uno", None, "F"),
+        2: ("dos@example.com", "922222222", "Two", None, "M"),
+    }
+
+
+def test_invalid_and_conflicting_records_are_rejected(app, client, make_users, admin_headers):
+    make_users(2)
+    body = ("id,email,name\n"
+            "3,member1@example.com,Taken\n"  # the e-mail of member 1
+            ",nobody@example.com,No id\n"
+            "4,four@example.com,Four\n")
+    report = post(client, body, admin_headers).get_json()
+    assert (report["created"], report["updated"], report["rejected"]) == (1, 0, 2)
+    assert [error["line"] for error in report["errors"]] == [3, 2]
+    assert set(users(app)) == {1, 2, 4}
+
+
+def test_batch_is_retried_after_a_concurrent_registration(app, make_users, monkeypatch):
+    from sqlalchemy.exc import IntegrityError
+
+    make_users(1)
+    write_batch = MemberImport.write_batch
+    attempts = []
+
+    def register_meanwhile(self, batch):
+        attempts.append(len(batch))
+        if len(attempts) == 1:  # member 2 registered between the checks and the inserts of the first attempt
+            db.session.execute(UserModel.__table__.insert(), [{"id": 2, "email": "two@example.com"}])
+            db.session.commit()
+            raise IntegrityError("INSERT INTO users", {}, Exception("UNIQUE constraint failed: users.id"))
+        return write_batch(self, batch)
+
+    monkeypatch.setattr(MemberImport, "write_batch", register_meanwhile)
+    with app.app_context():
+        importer = MemberImport()
+        importer.import_batch([(2, {"id": 2, "email": "two@example.com", "name": "Two"}),
+                               (3, {"id": 3, "email": "three@example.com", "name": "Three"})])
+    assert attempts == [2, 2]
+    assert (importer.created, importer.updated, importer.rejected) == (1, 1, 0)
+    assert users(app)[2] == ("two@example.com", None, "Two", None, None)
+
+
+def test_batch_is_rejected_when_the_retry_fails_too(app, monkeypatch):
+    from sqlalchemy.exc import IntegrityError
+
+    def always_conflicting(self, batch):
+        raise IntegrityError("INSERT INTO users", {}, Exception("UNIQUE constraint failed: users.email"))
+
+    monkeypatch.setattr(MemberImport, "write_batch", always_conflicting)
+    with app.app_context():
+        importer = MemberImport()
+        importer.import_batch([(2, {"id": 2, "email": "two@example.com"})])
+    assert (importer.created, importer.rejected) == (0, 1)
+    assert "concurrent change" in importer.errors[0]["reason"]
@@ -0,0 +1,76 @@
+"""
+libs.migrations.upgrade on a database created by the first version of the app, before the enrollment counter,
+the association primary key and the new indexes.
+"""
+from sqlalchemy import inspect, text
+
+from db import db
+from libs import migrations
+from models.course import CourseModel
+
+LEGACY_TABLES = (
+    "CREATE TABLE courses (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(80) NOT NULL, start_time TIME, "
+    "location VARCHAR(80) NOT NULL, month INTEGER, year INTEGER, day_week INTEGER, slots INTEGER)",
+    "CREATE TABLE association (courses INTEGER REFERENCES courses (id), users INTEGER REFERENCES users (id))",
+)
+
+
+def make_legacy_database(app) -> None:
+    with app.app_context():
+        db.session.remove()
+        with db.engine.begin() as connection:
+            connection.execute(text("DROP TABLE association"))
+            connection.execute(text("DROP TABLE enrollment_requests"))  # references courses
+            connection.execute(text("DROP TABLE courses"))
+            connection.execute(text("DROP INDEX ix_confirmations_user_expire_at"))
+            for statement in LEGACY_TABLES:
+                connection.execute(text(statement))
+            connection.execute(text(
+                "INSERT INTO courses (id, name, location, day_week, slots) VALUES "
+                "(1, 'Yoga', 'Main room', 0, 10), (2, 'Boxing', 'Ring', 1, 10)"
+            ))
+            connection.execute(text(
+                "INSERT INTO association (courses, users) VALUES (1, 1), (1, 2), (1, 2), (2, 1)"
+            ))
+
+
+def test_upgrade_brings_a_legacy_database_up_to_date(app, make_users):
+    make_users(2)
+    make_legacy_database(app)
+    with app.app_context():
+        db.create_all()  # as on startup: the missing tables only
+        applied = migrations.upgrade()
+        assert applied[:2] == ["courses.enrolled", "association primary key"]
+        assert {"ix_courses_timetable", "ix_confirmations_user_expire_at"} <= set(applied)
+
+        inspector = inspect(db.engine)
+        assert "ix_association_users" in {index["name"] for index in inspector.get_indexes("association")}
+        assert inspector.get_pk_constraint("association")["constrained_columns"] == ["courses", "users"]
+        rows = db.session.execute(text("SELECT courses, users FROM association ORDER BY courses, users")).fetchall()
+        assert [tuple(row) for row in rows] == [(1, 1), (1, 2), (2, 1)]
+        assert [course.enrolled for course in CourseModel.query.order_by(CourseModel.id)] == [2, 1]
+
+        assert migrations.upgrade() == []  # nothing left to do
+
+
+def test_upgrade_does_nothing_on_a_current_database(app):
+    with app.app_context():
+        assert migrations.upgrade() == []
+
+
+def test_upgrade_expires_duplicate_open_requests(app, make_course, make_users):
+    course_id = make_course()
+    user_id, other_id = make_users(2)
+    with app.app_context():
+        db.session.remove()
+        with db.engine.begin() as connection:
+            connection.execute(text("DROP INDEX ix_enrollment_requests_open"))
+            connection.execute(text(
+                "INSERT INTO enrollment_requests (id, ticket, course_id, user_id, status, created_at) VALUES "
+                "(1, 'a', :course, :user, 'waitlisted', 0), (2, 'b', :course, :user, 'queued', 0), "
+                "(3, 'c', :course, :other, 'queued', 0), (4, 'd', :course, :other, 'enrolled', 0)"
+            ), course=course_id, user=user_id, other=other_id)
+
+        assert migrations.upgrade() == ["ix_enrollment_requests_open"]
+        rows = db.session.execute(text("SELECT status FROM enrollment_requests ORDER BY id")).fetchall()
+        assert [status for status, in rows] == ["waitlisted", "expired", "queued", "enrolled"]
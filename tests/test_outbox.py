@@ -0,0 +1,92 @@
+import pytest
+
+from libs.outbox import FakeProvider
+
+
+class CrashingProvider(FakeProvider):
+    """
+    Delivers `crash_after` messages, then dies like a killed worker
+    """
+
+    def __init__(self, crash_after: int, on_deliver=None):
+        super().__init__()
+        self.crash_after = crash_after
+        self.on_deliver = on_deliver
+
+    def deliver(self, message) -> None:
+        if len(self.delivered) == self.crash_after:
+            raise SystemExit("worker killed")
+        super().deliver(message)
+        if self.on_deliver:
+            self.on_deliver(message)
+
+
+def queue(app, count: int) -> None:
+    from db import db
+    from models.outbox import OutboxModel
+
+    with app.app_context():
+        db.session.add_all([OutboxModel("sms", f"+35191000000{i}", {"body": "hello"}) for i in range(count)])
+        db.session.commit()
+
+
+def statuses(app) -> list:
+    from models.outbox import OutboxModel
+
+    with app.app_context():
+        return [message.status for message in OutboxModel.query.order_by(OutboxModel.id)]
+
+
+def test_each_delivery_is_recorded_before_the_next(app, monkeypatch):
+    from outbox import outbox
+
+    queue(app, 3)
+    monkeypatch.setattr(outbox, "provider", CrashingProvider(crash_after=2))
+    with app.app_context(), pytest.raises(SystemExit):
+        outbox.dispatch_once()
+    assert statuses(app) == ["sent", "sent", "pending"]
+
+
+def test_messages_taken_over_by_another_worker_are_skipped(app, monkeypatch):
+    from db import db
+    from models.outbox import OutboxModel
+    from outbox import outbox
+
+    def steal_the_rest(message):  # the lease of the rest of the batch expired and another worker claimed them
+        db.session.execute(
+            OutboxModel.__table__.update().where(OutboxModel.id > message.id).values(claimed_by="another-worker")
+        )
+        db.session.commit()
+
+    queue(app, 3)
+    monkeypatch.setattr(outbox, "provider", CrashingProvider(crash_after=10, on_deliver=steal_the_rest))
+    with app.app_context():
+        outbox.dispatch_once()
+    assert len(outbox.provider.delivered) == 1
+    assert statuses(app) == ["sent", "pending", "pending"]
+
+
+def test_delivery_status_is_only_shown_to_its_member(app, client, make_users, auth_headers):
+    from db import db
+    from models.outbox import OutboxModel
+
+    owner, other = make_users(2)
+    with app.app_context():
+        message = OutboxModel("email", "member1@example.com", {"subject": "hi"}, user_id=owner)
+        db.session.add(message)
+        db.session.commit()
+        message_id = message.id
+
+    assert client.get(f"/outbox/user/{owner}").status_code == 401
+    assert client.get(f"/outbox/{message_id}").status_code == 401
+    assert client.get(f"/outbox/user/{owner}", headers=auth_headers(other)).status_code == 403
+    assert client.get(f"/outbox/{message_id}", headers=auth_headers(other)).status_code == 404
+
+    response = client.get(f"/outbox/user/{owner}", headers=auth_headers(owner))
+    assert response.status_code == 200
+    dumped, = response.get_json()["messages"]
+    assert dumped["id"] == message_id and dumped["status"] == "pending"
+    assert not {"recipient", "last_error", "payload"} & set(dumped)
+    response = client.get(f"/outbox/{message_id}", headers=auth_headers(owner))
+    assert response.status_code == 200
+    assert "recipient" not in response.get_json()
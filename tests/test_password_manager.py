@@ -0,0 +1,73 @@
+import sys
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import password_manager
+
+
+def test_concurrent_first_hashes_share_one_pool(monkeypatch):
+    created = []
+
+    class CountingPool(password_manager.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            created.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(password_manager, "ProcessPoolExecutor", CountingPool)
+    monkeypatch.setattr(password_manager, "_pool", None)
+    monkeypatch.setattr(password_manager, "workers", 2)
+    monkeypatch.setattr(password_manager, "rounds", 1000)
+    try:
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            hashes = list(executor.map(password_manager.encrypt_password, ["secret"] * 32))
+        assert len(created) == 1
+        assert password_manager.check_encrypted_password("secret", hashes[0])
+    finally:
+        password_manager._pool.shutdown()
+
+
+def test_login_upgrades_a_weaker_hash(app, client, make_users, monkeypatch):
+    from db import db
+    from models.confirmation import ConfirmationModel
+    from models.user import UserModel
+
+    monkeypatch.setattr(password_manager, "workers", 0)
+    monkeypatch.setattr(password_manager, "rounds", 2000)
+    user_id, = make_users(1)
+    with app.app_context():
+        user = UserModel.find_by_id(user_id)
+        user.password = password_manager._hash("secret", 1000)  # below the minimum of 2000 rounds
+        confirmation = ConfirmationModel(user_id)
+        confirmation.confirmed = True
+        db.session.add(confirmation)
+        db.session.commit()
+
+    assert client.post("/login", json={"id": user_id, "password": "wrong"}).status_code == 401
+    with app.app_context():
+        assert UserModel.find_by_id(user_id).password.startswith("$pbkdf2-sha256$1000$")
+
+    assert client.post("/login", json={"id": user_id, "password": "secret"}).status_code == 200
+    with app.app_context():
+        upgraded = UserModel.find_by_id(user_id).password
+    assert upgraded.startswith("$pbkdf2-sha256$2000$")
+    assert password_manager.verify_and_update("secret", upgraded) == (True, None)
+    assert client.post("/login", json={"id": user_id, "password": "secret"}).status_code == 200
+
+
+def test_uwsgi_workers_start_their_pool_after_the_fork(monkeypatch):
+    hooks = []
+    monkeypatch.setitem(sys.modules, "uwsgidecorators", types.SimpleNamespace(postfork=hooks.append))
+    for name in ("_pool", "rounds", "workers"):  # restored after the test, init_app sets them
+        monkeypatch.setattr(password_manager, name, getattr(password_manager, name))
+    password_manager._pool = None
+    app = types.SimpleNamespace(config={"PASSWORD_HASH_ROUNDS": 1000, "PASSWORD_HASH_WORKERS": 2})
+    password_manager.init_app(app)
+    assert hooks == [password_manager.start_pool]
+    assert password_manager._pool is None  # not in the uwsgi master
+
+    hooks[0]()  # in each worker, right after the fork
+    try:
+        assert len(password_manager._pool._processes) == 2
+        assert password_manager.check_encrypted_password("secret", password_manager.encrypt_password("secret"))
+    finally:
+        password_manager._pool.shutdown()
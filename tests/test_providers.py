@@ -0,0 +1,136 @@
+"""
+Mailgun and Twilio against a local stand-in of their HTTP APIs (MAILGUN_API_URL, TWILIO_API_URL): the requests
+share pooled keep-alive connections, and announcements go out as one Mailgun request per batch of recipients.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from libs.mailgun import Mailgun
+from libs.twilio import Twilio
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        self.server.requests.append((self.client_address, self.path, form))
+        if "/Messages.json" in self.path:  # Twilio
+            status, body = 201, {"sid": "SM0", "status": "queued", "to": form["To"][0], "body": form["Body"][0]}
+        else:  # Mailgun
+            status, body = 200, {"id": "<0@mg.example.com>", "message": "Queued. Thank you."}
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    server.daemon_threads = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(Mailgun, "MAILGUN_API_URL", url)
+    monkeypatch.setattr(Mailgun, "MAILGUN_API_KEY", "key")
+    monkeypatch.setattr(Mailgun, "MAILGUN_DOMAIN", "mg.example.com")
+    monkeypatch.setattr(Mailgun, "_session", None)
+    monkeypatch.setattr(Twilio, "TWILIO_ACCOUNT_SID", "AC0")
+    monkeypatch.setattr(Twilio, "TWILIO_AUTH_TOKEN", "token")
+    monkeypatch.setattr(Twilio, "TWILIO_API_URL", url)
+    monkeypatch.setattr(Twilio, "_client", None)
+    yield server
+    if Mailgun._session is not None:
+        Mailgun._session.close()
+    if Twilio._client is not None:
+        Twilio._client.http_client.session.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_mailgun_reuses_its_connection(app, stand_in):
+    with app.app_context():
+        for i in range(5):
+            Mailgun.send_email([f"member{i}@example.com"], "Hello", "text", "<html>html</html>")
+    assert len(stand_in.requests) == 5
+    assert {path for _, path, _ in stand_in.requests} == {"/mg.example.com/messages"}
+    assert len({address for address, _, _ in stand_in.requests}) == 1
+
+
+def test_twilio_reuses_its_connection(app, stand_in):
+    with app.app_context():
+        for i in range(5):
+            Twilio.send_sms(number=f"+35191000000{i}", body="hello")
+    assert len(stand_in.requests) == 5
+    assert {path for _, path, _ in stand_in.requests} == {"/2010-04-01/Accounts/AC0/Messages.json"}
+    assert len({address for address, _, _ in stand_in.requests}) == 1
+
+
+def test_send_batch_splits_the_recipients(app, stand_in, monkeypatch):
+    monkeypatch.setattr(Mailgun, "BATCH_SIZE", 2)
+    recipients = {f"member{i}@example.com": {"id": i, "name": f"Member {i}"} for i in range(5)}
+    with app.app_context():
+        Mailgun.send_batch(recipients, "Cancelled", "Dear %recipient.name%, the class is cancelled")
+    assert [form["to"] for _, _, form in stand_in.requests] == [
+        ["member0@example.com", "member1@example.com"],
+        ["member2@example.com", "member3@example.com"],
+        ["member4@example.com"],
+    ]
+    for _, _, form in stand_in.requests:
+        variables = json.loads(form["recipient-variables"][0])
+        assert variables == {address: recipients[address] for address in form["to"]}
+        assert "html" not in form
+
+
+def test_announcement_is_staff_only(client, make_course, make_users, auth_headers):
+    course_id = make_course()
+    member, = make_users(1)
+    body = {"subject": "Free drinks", "text": "Reply with your card number"}
+    assert client.post(f"/course/{course_id}/announcement", json=body).status_code == 401
+    assert client.post(f"/course/{course_id}/announcement", json=body,
+                       headers=auth_headers(member)).status_code == 403
+
+
+def test_announcement_is_delivered_in_batches(app, client, stand_in, make_course, make_users, admin_headers,
+                                              monkeypatch):
+    from db import db
+    from libs.outbox import LiveProvider
+    from models.course import association_table
+    from models.outbox import OutboxModel
+    from outbox import outbox
+
+    monkeypatch.setattr(Mailgun, "BATCH_SIZE", 2)
+    monkeypatch.setattr(outbox, "provider", LiveProvider())
+    course_id = make_course()
+    user_ids = make_users(3)
+    with app.app_context():
+        db.session.execute(association_table.insert(), [{"users": _id, "courses": course_id} for _id in user_ids])
+        db.session.commit()
+
+    response = client.post(f"/course/{course_id}/announcement", headers=admin_headers,
+                           json={"subject": "Cancelled", "text": "Dear %recipient.name%, no class today"})
+    assert response.status_code == 202
+    assert response.get_json()["recipients"] == 3
+
+    with app.app_context():
+        outbox.dispatch_once()
+        assert [message.status for message in OutboxModel.query] == ["sent", "sent"]
+    assert [form["to"] for _, _, form in stand_in.requests] == [
+        ["member1@example.com", "member2@example.com"],
+        ["member3@example.com"],
+    ]
+    assert json.loads(stand_in.requests[1][2]["recipient-variables"][0]) == {
+        "member3@example.com": {"id": 3, "name": "Member 3"},
+    }
+    assert len({address for address, _, _ in stand_in.requests}) == 1
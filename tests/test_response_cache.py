@@ -0,0 +1,90 @@
+"""
+The cached roster (GetEnrolledUsers): ETags and 304s, and invalidation whenever the enrollments or the names of
+the enrolled members change.
+"""
+from cache import cache
+from db import db
+from models.user import UserModel
+
+
+def roster(client, course_id: int, **headers):
+    return client.get(f"/enrolled_users/{course_id}", headers=headers)
+
+
+def names(response) -> list:
+    return [user["name"] for user in response.get_json()["registered users"]]
+
+
+def enroll(client, action: str, course_id: int, user_id: int) -> None:
+    assert client.post(f"/{action}/", json={"course_id": course_id, "user_id": user_id}).status_code == 200
+
+
+def test_roster_answers_304_to_its_etag(client, make_course, make_users):
+    course_id = make_course()
+    user_id, = make_users(1)
+    enroll(client, "enroll", course_id, user_id)
+
+    first = roster(client, course_id)
+    assert first.status_code == 200 and first.headers["ETag"]
+    cached = roster(client, course_id, **{"If-None-Match": first.headers["ETag"]})
+    assert cached.status_code == 304
+    assert cached.data == b""
+    assert roster(client, course_id, **{"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_roster_follows_enrollments(client, make_course, make_users):
+    course_id = make_course()
+    first, second = make_users(2)
+    enroll(client, "enroll", course_id, first)
+    etag = roster(client, course_id).headers["ETag"]
+
+    enroll(client, "enroll", course_id, second)
+    response = roster(client, course_id, **{"If-None-Match": etag})
+    assert response.status_code == 200
+    assert names(response) == ["Member 1", "Member 2"]
+
+    enroll(client, "disenroll", course_id, first)
+    assert names(roster(client, course_id)) == ["Member 2"]
+
+
+def test_roster_follows_the_members(app, client, make_course, make_users, admin_headers):
+    course_id = make_course()
+    other_id = make_course(name="Boxing")
+    renamed, imported, deleted = make_users(3)
+    for user_id in (renamed, imported, deleted):
+        enroll(client, "enroll", course_id, user_id)
+    enroll(client, "enroll", other_id, deleted)
+    assert names(roster(client, course_id)) == ["Member 1", "Member 2", "Member 3"]
+    assert names(roster(client, other_id)) == ["Member 3"]
+
+    with app.app_context():
+        user = UserModel.find_by_id(renamed)
+        user.name = "Renamed"
+        user.save_to_db()
+    assert names(roster(client, course_id)) == ["Renamed", "Member 2", "Member 3"]
+
+    body = f"id,email,name\n{imported},member{imported}@example.com,Imported\n"
+    response = client.post("/users/import?format=csv", data=body.encode(), headers=admin_headers)
+    assert response.status_code == 200
+    assert names(roster(client, course_id)) == ["Renamed", "Imported", "Member 3"]
+
+    assert client.delete(f"/user/{deleted}").status_code == 200
+    assert names(roster(client, course_id)) == ["Renamed", "Imported"]
+    assert names(roster(client, other_id)) == []
+
+
+def test_other_user_changes_keep_the_roster_cached(app, client, make_course, make_users):
+    course_id = make_course()
+    user_id, = make_users(1)
+    enroll(client, "enroll", course_id, user_id)
+    roster(client, course_id)
+
+    with app.app_context():
+        user = UserModel.find_by_id(user_id)
+        user.phone = "910000000"
+        user.save_to_db()
+        assert UserModel.roster_namespaces(user_id) == [f"enrolled:{course_id}"]
+        db.session.remove()
+    misses = cache.misses
+    assert roster(client, course_id).status_code == 200
+    assert cache.misses == misses
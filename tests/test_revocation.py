@@ -0,0 +1,35 @@
+from time import time
+
+from libs.revocation import DatabaseBackend, RevocationStore
+
+
+def store() -> RevocationStore:
+    revocations = RevocationStore()
+    revocations.backend = DatabaseBackend()
+    revocations.sync_interval = 0
+    return revocations
+
+
+def test_logouts_reach_the_other_workers(app):
+    with app.app_context():
+        worker, other = store(), store()
+        assert "a" not in other
+        worker.add("a", int(time()) + 3600)
+        assert "a" in other
+
+
+def test_late_commits_and_reused_ids_are_not_missed(app):
+    from db import db
+    from models.revoked_token import RevokedTokenModel
+
+    table = RevokedTokenModel.__table__
+    with app.app_context():
+        worker, other = store(), store()
+        worker.add("a", int(time()) - 1)  # expired, pruned on the next sync
+        worker.add("b", int(time()) + 3600)
+        assert "b" in other
+        # the highest id is reused once pruned, and a slow transaction commits a row stamped before the last sync
+        db.session.execute(table.delete().where(table.c.jti == "b"))
+        db.session.execute(table.insert().values(jti="c", expire_at=int(time()) + 3600, created_at=time() - 5))
+        db.session.commit()
+        assert "c" in other
@@ -0,0 +1,24 @@
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def test_parallel_logins_load_their_own_user(app, make_users):
+    """
+    Threaded servers (uwsgi threads, uvicorn) run the resources concurrently, no request may see the user
+    another one is loading
+    """
+    users = make_users(20)  # imported members, registered without a password yet
+
+    def login(user_id: int) -> int:
+        return app.test_client().post("/login", json={"id": user_id, "password": "secret"}).status_code
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads as often as possible, like a loaded server
+    try:
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            statuses = Counter(executor.map(login, users * 25))
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert statuses == {400: len(users) * 25}
@@ -1,15 +1,96 @@
+"""
+Password hashing runs in a small process pool (PASSWORD_HASH_WORKERS processes per worker, 0 to hash inline),
+so CPU-heavy hashes don't hold the GIL of the request threads. The work factor is PASSWORD_HASH_ROUNDS, hashes
+made with fewer rounds are upgraded by verify_and_update on the next successful login.
+
+Under uwsgi the pool is started by a postfork hook, in each worker right after the fork: the hashing processes
+are forked in turn while the worker has no other threads yet, so they can't inherit a lock held by one of them.
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(
-        schemes=["pbkdf2_sha256"],
-        default="pbkdf2_sha256",
-        pbkdf2_sha256__default_rounds=3
-)
+DEFAULT_ROUNDS = 29000  # passlib's default for pbkdf2_sha256
+
+rounds = DEFAULT_ROUNDS
+workers = 0
+_pool = None
+_pool_lock = threading.Lock()
+_contexts = {}
+
+
+def init_app(app) -> None:
+    global rounds, workers
+    rounds = app.config.get("PASSWORD_HASH_ROUNDS", DEFAULT_ROUNDS)
+    workers = app.config.get("PASSWORD_HASH_WORKERS", 0)
+    try:
+        import uwsgidecorators  # only importable when running under uwsgi
+    except ImportError:
+        return
+    uwsgidecorators.postfork(start_pool)
+
+
+def start_pool() -> None:
+    """
+    Start the hashing processes, unless hashing is inline or they are already running
+    """
+    global _pool
+    if not workers:
+        return
+    with _pool_lock:  # by one thread, concurrent first requests would each start (and leak) a pool
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool.submit(_prepare, rounds).result()  # forks the processes now, instead of on the first login
+
+
+def _context(_rounds: int) -> CryptContext:
+    # one context per work factor, built in whichever process does the hashing
+    if _rounds not in _contexts:
+        _contexts[_rounds] = CryptContext(
+            schemes=["pbkdf2_sha256"],
+            default="pbkdf2_sha256",
+            pbkdf2_sha256__default_rounds=_rounds,
+            pbkdf2_sha256__min_rounds=_rounds,
+        )
+    return _contexts[_rounds]
+
+
+def _prepare(_rounds: int) -> None:
+    _context(_rounds)
+
+
+def _hash(password: str, _rounds: int) -> str:
+    return _context(_rounds).hash(password)
+
+
+def _verify(password: str, hashed: str, _rounds: int) -> bool:
+    return _context(_rounds).verify(password, hashed)
+
+
+def _verify_and_update(password: str, hashed: str, _rounds: int) -> Tuple[bool, Optional[str]]:
+    return _context(_rounds).verify_and_update(password, hashed)
+
+
+def _run(function, *args):
+    if not workers:
+        return function(*args, rounds)
+    if _pool is None:  # outside uwsgi, started by the first hash
+        start_pool()
+    return _pool.submit(function, *args, rounds).result()
 
 
 def encrypt_password(password):
-    return pwd_context.encrypt(password)
+    return _run(_hash, password)
 
 
 def check_encrypted_password(password, hashed):
-    return pwd_context.verify(password, hashed)
\ No newline at end of file
+    return _run(_verify, password, hashed)
+
+
+def verify_and_update(password, hashed) -> Tuple[bool, Optional[str]]:
+    """
+    Returns whether the password matches, and a new hash if the stored one was made with fewer rounds
+    """
+    return _run(_verify_and_update, password, hashed)